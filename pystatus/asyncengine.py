@@ -0,0 +1,205 @@
+import asyncio
+import functools
+import inspect
+import queue
+import threading
+import time
+from concurrent.futures import Executor, Future
+from pystatus.engine import IEngine, ThreadEngine
+
+
+class DaemonExecutor(Executor):
+    """A pool of up to max_workers daemon threads.
+
+    Unlike the workers of a ThreadPoolExecutor they aren't joined when the
+    interpreter exits, so an update stuck in one never keeps pystatus from
+    exiting.
+    """
+
+    def __init__(self, max_workers: int, thread_name_prefix: str):
+        self._max_workers = max_workers
+        self._prefix = thread_name_prefix
+        self._queue = queue.SimpleQueue()
+        self._idle = threading.Semaphore(0)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new futures after "
+                                   "shutdown")
+            future = Future()
+            self._queue.put((future, fn, args, kwargs))
+            if (not self._idle.acquire(blocking=False)
+                    and len(self._threads) < self._max_workers):
+                thread = threading.Thread(
+                    target=self._work, daemon=True,
+                    name="%s_%d" % (self._prefix, len(self._threads)))
+                thread.start()
+                self._threads.append(thread)
+            return future
+
+    def _work(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            future, fn, args, kwargs = item
+            if future.set_running_or_notify_cancel():
+                try:
+                    result = fn(*args, **kwargs)
+                except BaseException as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+            self._idle.release()
+
+    def shutdown(self, wait: bool = True, *,
+                 cancel_futures: bool = False) -> None:
+        with self._lock:
+            self._shutdown = True
+            threads = list(self._threads)
+        for _ in threads:
+            self._queue.put(None)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+
+class AsyncEngine(IEngine):
+    """Drives all instances from an asyncio event loop.
+
+    Coroutine updates run directly on the loop, synchronous updates are
+    offloaded to a bounded executor. Synchronous instances which declare
+    themselves as blocking get their own thread, so they can't starve the
+    executor, so do those whose update ran past its deadline once it
+    returns. Executor threads are daemons, a stuck one is left behind on
+    exit.
+    """
+
+    def __init__(self, workers: int = 4):
+        super().__init__()
+        self._loop: asyncio.AbstractEventLoop = None
+        self._resumed: asyncio.Event = None
+        self._pending = []
+        self._tasks = {}
+        # synchronous instances stuck in an update, moved to own threads
+        self._stuck = set()
+        self._threads = ThreadEngine()
+        self._executor = DaemonExecutor(workers, "pystatus_worker")
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return self._loop
+
+    def attach(self, loop: asyncio.AbstractEventLoop) -> None:
+        if not loop:
+            return
+        self._loop = loop
+        self._resumed = asyncio.Event()
+        self._resumed.set()
+        pending, self._pending = self._pending, []
+        for inst in pending:
+            self.add(inst)
+
+    def add(self, inst) -> None:
+        is_async = inspect.iscoroutinefunction(inst.update)
+        if inst.blocking and not is_async:
+            self.log.debug("Instance %s is blocking, using own thread",
+                           inst.name)
+            self._threads.add(inst)
+            return
+        if not self._loop:
+            self._pending.append(inst)
+            return
+        self._loop.call_soon_threadsafe(self._start, inst)
+
+    def _start(self, inst) -> None:
+        wakeup = asyncio.Event()
+        inst.waker = functools.partial(self._loop.call_soon_threadsafe,
+                                       wakeup.set)
+        if not inspect.iscoroutinefunction(inst.update):
+            # coroutines only hold up themselves, executor threads all
+            inst.on_timeout = functools.partial(self._stuck.add, inst)
+        self._tasks[inst] = self._loop.create_task(self._run(inst, wakeup))
+
+    def remove(self, inst) -> None:
+        self._threads.remove(inst)
+        if inst in self._pending:
+            self._pending.remove(inst)
+        elif self._loop:
+            self._loop.call_soon_threadsafe(self._remove, inst)
+
+    def _remove(self, inst) -> None:
+        task = self._tasks.pop(inst, None)
+        if not task:
+            return
+        # let a running update finish, the task ends once it sees the stop
+        inst.stop(join=False)
+        inst.wake()
+        task.add_done_callback(lambda _: inst.close())
+
+    def pause(self) -> None:
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._pause)
+        self._threads.pause()
+
+    def _pause(self) -> None:
+        self._resumed.clear()
+        # get every task waiting for resume instead of its next deadline
+        for inst in self._tasks:
+            inst.wake()
+
+    def resume(self) -> None:
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._resumed.set)
+        self._threads.resume()
+
+    async def _run(self, inst, wakeup: asyncio.Event) -> None:
+        is_async = inspect.iscoroutinefunction(inst.update)
+        due = time.monotonic()
+        while not inst.stopped:
+            if not self._resumed.is_set():
+                await self._resumed.wait()
+                continue
+            if is_async:
+                await inst.atick()
+            else:
+                # tick() records the update without the time spent queued
+                await self._loop.run_in_executor(self._executor, inst.tick)
+                if inst in self._stuck:
+                    self._hand_over(inst)
+                    return
+            now = time.monotonic()
+            due = inst.next_deadline(due, now)
+            try:
+                await asyncio.wait_for(wakeup.wait(), due - now)
+                due = time.monotonic()
+            except asyncio.TimeoutError:
+                pass
+            wakeup.clear()
+
+    def _hand_over(self, inst) -> None:
+        self._stuck.discard(inst)
+        self._tasks.pop(inst, None)
+        if inst.stopped:
+            inst.close()
+            return
+        self.log.info("Instance %s continues in its own thread", inst.name)
+        inst.waker = None
+        inst.on_timeout = None
+        self._threads.add(inst)
+
+    def stop(self) -> None:
+        # may be called from within the loop, so never wait for tasks here
+        for inst in self._tasks:
+            inst.stop(join=False)
+            inst.close()
+        for task in self._tasks.values():
+            self._loop.call_soon_threadsafe(task.cancel)
+        self._tasks = {}
+        self._pending = []
+        self._executor.shutdown(wait=False)
+        self._threads.stop()
@@ -0,0 +1,552 @@
+from argparse import ArgumentParser
+import contextlib
+import glob
+import itertools
+import json
+import os
+import platform
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+from types import MappingProxyType
+from typing import Callable, Dict, Iterator, List
+
+
+SUITES = ["providers", "sendline", "block", "plugins", "startup", "steady"]
+
+# wall time pystatus --once may take with a clock only configuration
+STARTUP_TARGET = 0.1
+
+_CLOCK_CONFIG = """<?xml version="1.0"?>
+<pystatus><blocks><block plugin="clock"/></blocks></pystatus>
+"""
+# blocks a typical bar shows which don't depend on the hardware
+REFERENCE_CONFIG = """<?xml version="1.0"?>
+<pystatus>
+    <engine>%s</engine>
+    <blocks>
+        <block plugin="uptime"/>
+        <block plugin="cpu"/>
+        <block plugin="loadavg"/>
+        <block plugin="memory"/>
+        <block plugin="disk" name="/"/>
+        <block plugin="clock"/>
+    </blocks>
+</pystatus>
+"""
+# like the installed console script, so no module is compiled each run
+_MAIN = ("import sys; from pystatus.cli import main; "
+         "sys.argv[1:] = ['--log-config', ''] + sys.argv[1:]; main()")
+
+# fake procfs and sysfs files, path -> content
+_PROCFS = {
+    "stat": "cpu  4705 356 584 3699 23 23 0 0 0 0\n"
+            "cpu0 1393 280 283 1846 13 19 0 0 0 0\n"
+            "cpu1 3312 76 301 1853 10 4 0 0 0 0\n"
+            "intr 114930548 113199788 3 0 5 263 0 4 [...]\n",
+    "meminfo": "MemTotal:       16307664 kB\n"
+               "MemFree:         6186156 kB\n"
+               "MemAvailable:   11274772 kB\n"
+               "Buffers:          313060 kB\n"
+               "Cached:          4843364 kB\n"
+               "SwapCached:            0 kB\n"
+               "SwapTotal:       8388604 kB\n"
+               "SwapFree:        8388604 kB\n",
+}
+_SYSFS = {
+    "class/power_supply/BAT0/type": "Battery",
+    "class/power_supply/BAT0/status": "Discharging",
+    "class/power_supply/BAT0/energy_now": "35260000",
+    "class/power_supply/BAT0/energy_full": "47520000",
+    "class/power_supply/AC/type": "Mains",
+    "class/power_supply/AC/online": "0",
+    "class/hwmon/hwmon0/name": "coretemp",
+    "class/hwmon/hwmon0/temp1_label": "Package id 0",
+    "class/hwmon/hwmon0/temp1_input": "45000",
+    "class/hwmon/hwmon0/temp2_input": "43000",
+}
+_STUBS = {
+    "wpa_cli": "#!/bin/sh\n"
+               "printf 'bssid=00:11:22:33:44:55\\nssid=home\\n"
+               "wpa_state=COMPLETED\\n'\n",
+    "zfs": "#!/bin/sh\n"
+           "[ \"$1\" = version ] && echo zfs-2.2 && exit 0\n"
+           "printf 'tank\\t123456789\\t42\\n'\n",
+}
+
+
+def _per_call(fn: Callable, number: int = None, repeat: int = 5) -> float:
+    """Best time of a single call in microseconds.
+
+    Without number, it is chosen so a measurement takes at least 0.2s.
+    """
+    timer = timeit.Timer(fn)
+    if not number:
+        number, _ = timer.autorange()
+    times = timer.repeat(number=number, repeat=repeat)
+    return min(times) / number * 1e6
+
+
+def _write_tree(root: str, files: Dict[str, str]) -> None:
+    for path, content in files.items():
+        path = os.path.join(root, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+
+
+@contextlib.contextmanager
+def fixtures() -> Iterator[Dict[str, str]]:
+    """Fake procfs and sysfs trees plus stub wpa_cli and zfs binaries.
+
+    procfs and sysfs are pointed to the fake trees while in the context,
+    providers created before keep reading the real files.
+    """
+    from pystatus.internal import procfs, sysfs
+    with tempfile.TemporaryDirectory(prefix="pystatus-bench-") as root:
+        paths = {name: os.path.join(root, name)
+                 for name in ("proc", "sys", "bin", "run")}
+        _write_tree(paths["proc"], _PROCFS)
+        _write_tree(paths["sys"], _SYSFS)
+        _write_tree(paths["bin"], _STUBS)
+        os.makedirs(paths["run"])
+        for name in _STUBS:
+            os.chmod(os.path.join(paths["bin"], name), 0o755)
+        saved = procfs.PROCFS, sysfs.SYSFS
+        procfs.PROCFS, sysfs.SYSFS = paths["proc"], paths["sys"]
+        try:
+            yield paths
+        finally:
+            procfs.PROCFS, sysfs.SYSFS = saved
+
+
+def bench_providers(number: int = 2000) -> Dict[str, Dict[str, float]]:
+    """Per sample cost of the provider backends available here."""
+    from pystatus.internal import providers as p
+    backends = {
+        "cpu_times": {"procfs": p.ProcCPUTimesProvider,
+                      "psutil": p.PsutilCPUTimesProvider},
+        "meminfo": {"procfs": p.ProcMemInfoProvider,
+                    "psutil": p.PsutilMemInfoProvider},
+        "loadavg": {"os": p.OSLoadavgProvider,
+                    "psutil": p.PsutilLoadavgProvider},
+        "uptime": {"clock": p.BoottimeUptimeProvider,
+                   "psutil": p.PsutilUptimeProvider},
+    }
+    results = {}
+    for name, classes in backends.items():
+        results[name] = {}
+        for backend, cls in classes.items():
+            try:
+                provider = cls()
+            except (OSError, AttributeError):
+                continue
+            results[name][backend] = _per_call(provider.sample, number)
+    return results
+
+
+class _NullWriter:
+    def write(self, data: str) -> None:
+        pass
+
+    def flush(self) -> None:
+        pass
+
+
+def bench_sendline(sizes: List[int] = (10, 100, 1000),
+                   number: int = None) -> Dict[str, Dict[str, float]]:
+    """Cost of a frame in microseconds by number of blocks.
+
+    Frames are measured with no, one and all blocks changed since the
+    previous one, including publishing the changes.
+    """
+    from pystatus.i3bar import Statusline
+    results = {}
+    for size in sizes:
+        statusline = Statusline(_NullWriter(), None)
+        blocks = [statusline.new_block("bench", "block%d" % i)
+                  for i in range(size)]
+        for block in blocks:
+            with block:
+                block.full_text = "B: 0"
+                block.color = "#ffffff"
+        statusline.start()
+        counter = itertools.count()
+
+        def one():
+            blocks[0].full_text = "B: %d" % next(counter)
+            statusline.sendline()
+
+        def every():
+            text = "B: %d" % next(counter)
+            for block in blocks:
+                block.full_text = text
+            statusline.sendline()
+
+        results[str(size)] = {
+            "unchanged": _per_call(statusline.sendline, number),
+            "one_changed": _per_call(one, number),
+            "all_changed": _per_call(every, number),
+        }
+    return results
+
+
+class _DictSnapshot:
+    __slots__ = ("_version", "_fields", "_fragment")
+
+    def __init__(self, version: int, fields: dict):
+        self._version = version
+        self._fields = MappingProxyType(dict(fields))
+        self._fragment: str = None
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def fragment(self) -> str:
+        if self._fragment is None:
+            self._fragment = json.dumps(
+                {k: v for k, v in self._fields.items() if v})
+        return self._fragment
+
+
+class _DictBlock:
+    """A block keeping its fields in a dict, like i3bar.Block used to.
+
+    Only what bench_block() uses, the reference slots are compared to.
+    """
+
+    def __init__(self, name: str, instance: str):
+        self._lock = threading.Lock()
+        self._owner: int = None
+        self._pending = False
+        self._obj = {"name": name, "instance": instance}
+        self._snapshot = _DictSnapshot(0, self._obj)
+
+    def _set(self, key: str, value) -> None:
+        if self._owner != threading.get_ident():
+            with self:
+                self._set(key, value)
+            return
+        if key not in self._obj or self._obj[key] != value:
+            self._obj[key] = value
+            self._pending = True
+
+    @property
+    def snapshot(self) -> _DictSnapshot:
+        return self._snapshot
+
+    @property
+    def full_text(self) -> str:
+        return self._obj["full_text"]
+
+    @full_text.setter
+    def full_text(self, value: str) -> None:
+        self._set("full_text", value)
+
+    @property
+    def short_text(self) -> str:
+        return self._obj["short_text"]
+
+    @short_text.setter
+    def short_text(self, value: str) -> None:
+        self._set("short_text", value)
+
+    @property
+    def color(self) -> str:
+        return self._obj["color"]
+
+    @color.setter
+    def color(self, value: str) -> None:
+        self._set("color", value)
+
+    def __enter__(self) -> "_DictBlock":
+        self._lock.acquire()
+        self._owner = threading.get_ident()
+        return self
+
+    def __exit__(self, t, v, tb) -> None:
+        try:
+            if self._pending:
+                self._pending = False
+                self._snapshot = _DictSnapshot(self._snapshot.version + 1,
+                                               self._obj)
+        finally:
+            self._owner = None
+            self._lock.release()
+
+
+def bench_block(sizes: List[int] = (10, 100, 1000), number: int = None
+                ) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """Memory and update cost of i3bar.Block against a dict-backed block.
+
+    Bytes per block include its published snapshot. An update is a
+    transaction changing three fields, serializing additionally builds the
+    fragment of the published snapshot. Times are in microseconds.
+    """
+    import tracemalloc
+    from pystatus.i3bar import Block
+    results = {}
+    for size in sizes:
+        results[str(size)] = {}
+        for kind, cls in (("slots", Block), ("dict", _DictBlock)):
+            tracemalloc.start()
+            before = tracemalloc.get_traced_memory()[0]
+            blocks = [cls("bench", "block%d" % i) for i in range(size)]
+            for block in blocks:
+                with block:
+                    block.full_text = block.short_text = "B: 0"
+                    block.color = "#ffffff"
+            used = tracemalloc.get_traced_memory()[0] - before
+            tracemalloc.stop()
+            cycle = itertools.cycle(blocks)
+            counter = itertools.count()
+
+            def update():
+                block, text = next(cycle), "B: %d" % next(counter)
+                with block:
+                    block.full_text = block.short_text = text
+                    block.color = "#ffffff"
+                return block
+
+            def serialize():
+                update().snapshot.fragment()
+
+            results[str(size)][kind] = {
+                "bytes_per_block": used / size,
+                "update": _per_call(update, number),
+                "serialize": _per_call(serialize, number),
+            }
+    return results
+
+
+def _plugin_blocks(paths: Dict[str, str]) -> Dict[str, tuple]:
+    # plugin -> (block name, options) to benchmark it with
+    return {
+        "battery": ("battery", {}),
+        "clock": ("clock", {}),
+        "cpu": ("cpu", {}),
+        "disk": (paths["run"], {}),
+        "loadavg": ("loadavg", {}),
+        "memory": ("memory", {}),
+        "pystatus": ("pystatus", {}),
+        "temperature": ("temperature", {}),
+        "uptime": ("uptime", {}),
+        "wifi": ("wlan0", {
+            "wpa_cli": os.path.join(paths["bin"], "wpa_cli"),
+            "ctrl_dir": paths["run"],
+        }),
+        "zfs": ("tank", {"zfs": os.path.join(paths["bin"], "zfs")}),
+    }
+
+
+def bench_plugins(number: int = None) -> Dict[str, float]:
+    """Cost of an update of every internal plugin in microseconds.
+
+    Plugins read the fake fixtures and sample their sources on every
+    update, as if their interval had just passed.
+    """
+    import pystatus.internal
+    from pystatus.i3bar import Block
+    results = {}
+    with fixtures() as paths:
+        blocks = _plugin_blocks(paths)
+        for name in pystatus.internal.PLUGINS:
+            block_name, options = blocks[name]
+            plugin = pystatus.internal.plugin(name)()
+            inst = plugin.instance(block_name, Block(name, block_name),
+                                   0, dict(options))
+            try:
+                inst.tick()
+                results[name] = _per_call(inst.tick, number, repeat=3)
+            finally:
+                inst.close()
+    return results
+
+
+@contextlib.contextmanager
+def _config(content: str = None, path: str = None) -> Iterator[str]:
+    if path:
+        yield path
+        return
+    fd, path = tempfile.mkstemp(prefix="pystatus-bench-", suffix=".cfg")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+        yield path
+    finally:
+        os.unlink(path)
+
+
+def bench_startup(config: str = None,
+                  number: int = 10) -> Dict[str, float]:
+    """Wall time of pystatus --once in seconds, from exec to exit."""
+    times = []
+    with _config(_CLOCK_CONFIG, config) as path:
+        for _ in range(number):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", _MAIN, "--once",
+                            "-c", path],
+                           check=True, stdout=subprocess.DEVNULL)
+            times.append(time.perf_counter() - start)
+    return {"min": min(times), "median": statistics.median(times),
+            "target": STARTUP_TARGET}
+
+
+def _first_frame(path: str) -> float:
+    start = time.perf_counter()
+    p = subprocess.Popen([sys.executable, "-c", _MAIN, "-c", path],
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                         stderr=subprocess.DEVNULL)
+    try:
+        decoder = json.JSONDecoder()
+        data = ""
+        while True:
+            chunk = os.read(p.stdout.fileno(), 65536)
+            if not chunk:
+                raise RuntimeError("pystatus exited before the first frame")
+            data += chunk.decode("utf8")
+            # the header, the opening bracket and the first frame
+            try:
+                _, end = decoder.raw_decode(data)
+                rest = data[end:].lstrip()[1:].lstrip()
+                decoder.raw_decode(rest)
+            except ValueError:
+                continue
+            return time.perf_counter() - start
+    finally:
+        p.send_signal(signal.SIGINT)
+        p.communicate()
+
+
+def bench_first_frame(config: str = None, number: int = 5,
+                      engine: str = "thread") -> Dict[str, float]:
+    """Wall time in seconds from exec until the first frame arrived."""
+    with _config(REFERENCE_CONFIG % engine, config) as path:
+        times = [_first_frame(path) for _ in range(number)]
+    return {"min": min(times), "median": statistics.median(times)}
+
+
+def _usage(pid: int) -> tuple:
+    """CPU seconds and context switches of all threads of a process."""
+    with open("/proc/%d/stat" % pid) as f:
+        # the command may contain spaces, the fields follow its ")"
+        fields = f.read().rsplit(")", 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    switches = 0
+    for status in glob.glob("/proc/%d/task/*/status" % pid):
+        try:
+            with open(status) as f:
+                for line in f:
+                    name, _, value = line.partition(":")
+                    # voluntary and nonvoluntary
+                    if name.endswith("ctxt_switches"):
+                        switches += int(value)
+        except OSError:
+            # the thread just exited
+            pass
+    return cpu, switches
+
+
+def bench_steady(config: str = None, duration: float = 10.0,
+                 engine: str = "thread") -> Dict[str, float]:
+    """CPU usage and wakeups per minute of a running pystatus.
+
+    Wakeups are counted as context switches of all threads, measured
+    after the first frame for duration seconds.
+    """
+    with _config(REFERENCE_CONFIG % engine, config) as path:
+        p = subprocess.Popen([sys.executable, "-c", _MAIN, "-c", path],
+                             stdin=subprocess.PIPE,
+                             stdout=subprocess.DEVNULL,
+                             stderr=subprocess.DEVNULL)
+        try:
+            # skip the startup
+            time.sleep(1.0)
+            cpu, switches = _usage(p.pid)
+            time.sleep(duration)
+            cpu_end, switches_end = _usage(p.pid)
+        finally:
+            p.send_signal(signal.SIGINT)
+            p.communicate()
+    return {
+        "cpu_percent": (cpu_end - cpu) / duration * 100,
+        "wakeups_per_minute": (switches_end - switches) / duration * 60,
+    }
+
+
+def run(suites: List[str], number: int = None, config: str = None,
+        duration: float = 10.0, engines: List[str] = None) -> dict:
+    """Run the given suites, returns their results with some context."""
+    import pystatus
+    from pystatus.engine import ENGINES
+    engines = engines or ENGINES
+    results = {
+        "version": pystatus.__version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.time(),
+    }
+    if "providers" in suites:
+        results["providers"] = bench_providers(number or 2000)
+    if "sendline" in suites:
+        results["sendline"] = bench_sendline(number=number)
+    if "block" in suites:
+        results["block"] = bench_block(number=number)
+    if "plugins" in suites:
+        results["plugins"] = bench_plugins(number)
+    if "startup" in suites:
+        results["startup"] = {
+            "once": bench_startup(config),
+            "first_frame": {e: bench_first_frame(config, engine=e)
+                            for e in engines},
+        }
+    if "steady" in suites:
+        results["steady"] = {e: bench_steady(config, duration, e)
+                             for e in engines}
+    return results
+
+
+def main():
+    parser = ArgumentParser(description="pystatus benchmarks, results are "
+                                        "written as JSON.")
+    parser.add_argument("suites", nargs="*",
+                        help="Suites to run, all by default: %s."
+                             % ", ".join(SUITES))
+    parser.add_argument("-n", "--number", type=int,
+                        help="Calls per measurement, chosen per measurement "
+                             "by default.")
+    parser.add_argument("-c", "--config", type=str,
+                        help="Configuration to measure startup and steady "
+                             "state with, instead of the built-in ones.")
+    parser.add_argument("-d", "--duration", type=float, default=10.0,
+                        help="Seconds to measure the steady state for.")
+    parser.add_argument("-e", "--engine", action="append",
+                        help="Engine to measure startup and steady state "
+                             "with, may be given several times.")
+    parser.add_argument("-o", "--output", type=str,
+                        help="File to write the results to, instead of "
+                             "stdout.")
+    args = parser.parse_args()
+    unknown = set(args.suites) - set(SUITES)
+    if unknown:
+        parser.error("unknown suites: %s" % ", ".join(sorted(unknown)))
+
+    results = run(args.suites or SUITES, args.number, args.config,
+                  args.duration, args.engine)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,33 @@
 from argparse import ArgumentParser
 import logging
-import logging.config
 import os
 import signal
 import sys
+import threading
 import time
+import xml.etree.ElementTree as ET
+from pystatus.clicks import ClickReader
 from pystatus.helpers import config_path
 from pystatus.config import Config
 from pystatus.i3bar import Statusline
+from pystatus.metrics import MetricsWriter, exposition
 from pystatus.plugin import PluginParent
+from pystatus.profiling import Profiler
+from pystatus.engine import OneShotEngine, create_engine
+from pystatus.writer import FrameWriter
+
+
+# sent by i3bar instead of SIGSTOP/SIGCONT while the bar is hidden
+STOP_SIGNAL = signal.SIGUSR1
+CONT_SIGNAL = signal.SIGUSR2
+SIGNALS = (signal.SIGINT, signal.SIGHUP, STOP_SIGNAL, CONT_SIGNAL)
+# options which only take effect on restart, not on reload
+RESTART_OPTIONS = ("engine", "slack", "workers", "writer", "click_events",
+                   "plugindir")
+# seconds the old blocks are shown at most while the new ones start
+SWAP_TIMEOUT = 10.0
+# seconds between checks whether the new blocks are ready
+SWAP_POLL = 0.1
 
 
 class PystatusCli:
@@ -25,10 +44,39 @@ class PystatusCli:
                             type=str,
                             default=config_path("logging.cfg"),
                             help="Path to log configuration file.")
+        parser.add_argument("--once",
+                            nargs="?", const="text", choices=["text", "json"],
+                            help="Print a single status line and exit, as "
+                                 "plain text (default) or i3bar JSON.")
+        parser.add_argument("--metrics-file",
+                            type=str,
+                            help="Write runtime metrics of all blocks to "
+                                 "this file in Prometheus text format.")
+        parser.add_argument("--metrics-interval",
+                            type=float,
+                            default=10.0,
+                            help="Seconds between rewrites of the metrics "
+                                 "file.")
+        parser.add_argument("--profile",
+                            type=float,
+                            metavar="SECONDS",
+                            help="Run for SECONDS, then exit and report the "
+                                 "CPU time of every block, the serializer "
+                                 "and the writer.")
+        parser.add_argument("--profile-memory",
+                            type=float,
+                            metavar="SECONDS",
+                            help="Trace allocations while profiling and "
+                                 "report their growth every SECONDS.")
+        parser.add_argument("--profile-output",
+                            type=str,
+                            help="Write the profile to this file instead "
+                                 "of stderr.")
         self._args = parser.parse_args()
 
         if os.path.exists(self._args.log_config):
-            logging.config.fileConfig(self._args.log_config)
+            from logging.config import fileConfig
+            fileConfig(self._args.log_config)
         else:
             logfmt = "%(asctime)-15s %(name)s [%(levelname)s]: %(message)s"
             logging.basicConfig(level=logging.DEBUG
@@ -37,13 +85,30 @@ class PystatusCli:
                                 stream=sys.stderr)
 
         self._stop = False
+        self._reload = False
+        # event loop of the asyncio engine, once running
+        self._loop = None
+        self._clicks: ClickReader = None
+        self._metrics: MetricsWriter = None
+        # instances to wake up per real-time signal
+        self._refresh = {}
+        # (config key, instance, block) of every configured block, in order
+        self._running = []
+        # reloaded configuration waiting for the first updates of its blocks
+        self._swap: tuple = None
         self._cfg = Config()
         self._parent = PluginParent()
         self._statusline = Statusline(sys.stdout,
                                       4 if self._args.debug else None)
+        self._profiler: Profiler = None
+        if self._args.profile is not None:
+            self._profiler = Profiler(
+                memory_interval=self._args.profile_memory)
+            self._parent.profiler = self._profiler
+            self._statusline.profiler = self._profiler
 
-        signal.signal(signal.SIGINT, self.sighandler)
-        signal.signal(signal.SIGHUP, self.sighandler)
+        for signum in SIGNALS:
+            signal.signal(signum, self.sighandler)
 
     @property
     def cfg(self) -> Config:
@@ -57,6 +122,15 @@ class PystatusCli:
     def statusline(self) -> Statusline:
         return self._statusline
 
+    @property
+    def once(self) -> bool:
+        return self._args.once is not None
+
+    @property
+    def is_async(self) -> bool:
+        """Whether the process runs on an asyncio event loop."""
+        return not self.once and self.cfg.engine == "asyncio"
+
     @property
     def should_stop(self) -> bool:
         return self._stop
@@ -67,43 +141,348 @@ class PystatusCli:
 
     def load(self):
         self.cfg.load(self._args.config)
-        self.parent.load_plugins(self.cfg.plugindir)
+        if (self.cfg.writer == "nonblocking" and not self.once
+                and not self.statusline.is_open
+                and not isinstance(self.statusline.writer, FrameWriter)):
+            sys.stdout.flush()
+            self.statusline.writer = FrameWriter(sys.stdout.fileno())
+        if self.once:
+            self.parent.engine = OneShotEngine()
+        else:
+            self.parent.engine = create_engine(self.cfg.engine,
+                                               self.cfg.slack,
+                                               self.cfg.workers)
+        self.parent.load_plugins(self.cfg.plugindir, self.cfg.plugins)
         self.cfg.load_blocks()
 
     def setup(self):
-        for block in self.cfg.blocks:
-            self.parent.instance(block.plugin, block.name,
-                                 self.statusline.new_block(block.plugin,
-                                                           block.name),
-                                 block.interval, block.options())
+        self._running = [self._create(block, True)
+                         for block in self.cfg.blocks]
+        self._install_refresh_signals()
+
+    def _key(self, conf) -> tuple:
+        # blocks of a changed plugin module are started again as well
+        return conf.key + (self.parent.stamp(conf.plugin),)
+
+    def _create(self, conf, append: bool) -> tuple:
+        block = self.statusline.new_block(conf.plugin, conf.name, append)
+        inst = self.parent.instance(conf.plugin, conf.name, block,
+                                    conf.interval, conf.options())
+        return (self._key(conf), inst, block)
+
+    def reload(self):
+        """Apply a changed configuration, only touching changed blocks.
+
+        Blocks configured exactly as before keep running with their state,
+        new or changed ones are started next to the old ones. The old
+        blocks are shown until every new one finished its first update,
+        see swap().
+        """
+        self._reload = False
+        # a newer configuration replaces one still waiting to be shown
+        self._cancel_swap()
+        cfg = Config()
+        try:
+            cfg.load(self._args.config)
+            # only new plugins are imported, unchanged modules aren't read
+            self.parent.load_plugins(cfg.plugindir, cfg.plugins)
+            cfg.load_blocks()
+        except (SystemExit, ET.ParseError, OSError, ValueError,
+                TypeError) as e:
+            self.log.error("Invalid configuration, keeping the old one: %s",
+                           e)
+            return
+        for name in RESTART_OPTIONS:
+            if getattr(cfg, name) != getattr(self.cfg, name):
+                self.log.warning("Changing %s requires a restart", name)
+                setattr(cfg, name, getattr(self.cfg, name))
+
+        unused = {}
+        for entry in self._running:
+            unused.setdefault(entry[0], []).append(entry)
+        keys = [self._key(b) for b in cfg.blocks]
+        kept = [unused[key].pop(0) if unused.get(key) else None
+                for key in keys]
+        running, created = [], []
+        try:
+            for block, entry in zip(cfg.blocks, kept):
+                if not entry:
+                    entry = self._create(block, False)
+                    created.append(entry[1])
+                running.append(entry)
+        except (SystemExit, Exception) as e:
+            # plugins exit on invalid options, the old blocks keep running
+            self.log.error("Failed to start block %s:%s, keeping the old "
+                           "configuration", block.plugin, block.name,
+                           exc_info=not isinstance(e, SystemExit))
+            self._discard(created)
+            return
+        removed = [inst for entries in unused.values()
+                   for _, inst, _ in entries]
+        self._swap = (cfg, running, created, removed,
+                      time.monotonic() + SWAP_TIMEOUT)
+        self.swap()
+
+    def swap(self) -> bool:
+        """Show the reloaded blocks once all new ones were updated.
+
+        Returns whether the status line changed. After SWAP_TIMEOUT
+        seconds new blocks are shown even if they are still updating.
+        """
+        if not self._swap:
+            return False
+        cfg, running, created, removed, deadline = self._swap
+        waiting = [inst for inst in created if inst and not inst.updated]
+        if waiting and time.monotonic() < deadline:
+            return False
+        for inst in waiting:
+            self.log.warning("Showing %s before its first update finished",
+                             inst.label)
+        self._swap = None
+        self._remove(removed)
+        self.log.info("Reloaded configuration, kept %d of %d blocks",
+                      len(running) - len(created), len(running))
+        self._cfg = cfg
+        self._running = running
+        self.statusline.set_blocks([block for _, _, block in running])
+        self._install_refresh_signals()
+        return True
+
+    def _cancel_swap(self):
+        if self._swap:
+            self._discard(self._swap[2])
+            self._swap = None
+
+    def _discard(self, created: list):
+        self._remove(created)
+        # the running instances of the same names are found again
+        for _, inst, _ in self._running:
+            if inst:
+                self.parent.register(inst)
+
+    def _remove(self, instances: list):
+        for inst in instances:
+            if inst:
+                self.parent.remove(inst)
+
+    def metrics(self) -> str:
+        """Runtime metrics of all running blocks in Prometheus format."""
+        writer = self.statusline.writer
+        return exposition([inst for _, inst, _ in self._running if inst],
+                          self.statusline.stats,
+                          getattr(writer, "dropped", None))
+
+    def _start_metrics(self):
+        if not self._args.metrics_file:
+            return
+        self._metrics = MetricsWriter(self._args.metrics_file,
+                                      self._args.metrics_interval,
+                                      self.metrics)
+        self._metrics.start()
+
+    def _start_profile(self):
+        if not self._profiler:
+            return
+        self._profiler.start()
+        if self.once:
+            return
+        # stop just like on SIGINT, from the main loop
+        timer = threading.Timer(self._args.profile, os.kill,
+                                (os.getpid(), signal.SIGINT))
+        timer.daemon = True
+        timer.start()
+
+    def _write_profile(self):
+        if not self._profiler:
+            return
+        self._profiler.stop()
+        report = self._profiler.report()
+        if not self._args.profile_output:
+            sys.stderr.write(report)
+            return
+        try:
+            with open(self._args.profile_output, "w") as f:
+                f.write(report)
+        except OSError as e:
+            self.log.error("Failed to write profile to %s: %s",
+                           self._args.profile_output, e)
+            return
+        self.log.info("Wrote profile to %s", self._args.profile_output)
+
+    def _install_refresh_signals(self):
+        refresh = {}
+        for inst in self.parent.instances:
+            if inst.signal is None:
+                continue
+            signum = signal.SIGRTMIN + inst.signal
+            if signum > signal.SIGRTMAX:
+                self.log.error("Signal %d of %s is out of range",
+                               inst.signal, inst.name)
+                continue
+            refresh.setdefault(signum, []).append(inst)
+        self._refresh = refresh
+        for signum in refresh:
+            if self._loop and self._loop.is_running():
+                self._loop.add_signal_handler(signum, self.refresh,
+                                              signum, None)
+            else:
+                signal.signal(signum, self.refresh)
+
+    def refresh(self, signum, frame):
+        for inst in self._refresh.get(signum, []):
+            inst.refresh()
+
+    def on_click(self, event: dict):
+        inst = self.parent.find(event.get("name"), event.get("instance"))
+        if not inst:
+            self.log.debug("Click on unknown block %s", event)
+            return
+        inst.on_click(event)
+        inst.refresh()
+
+    def _start(self):
+        self.statusline.start(stop_signal=STOP_SIGNAL,
+                              cont_signal=CONT_SIGNAL,
+                              click_events=self.cfg.click_events)
+        if self.cfg.click_events:
+            self._clicks = ClickReader(sys.stdin.fileno(), self.on_click)
+            self._clicks.start()
+        self._start_metrics()
+        self._start_profile()
 
     def sighandler(self, signum, frame):
         if signum == signal.SIGINT:
+            if self.should_stop:
+                # already closing, e.g. SIGINT sent to the whole group
+                return
             self.log.info("Received SIGINT, closing...")
+            # stop from the main loop, never within a frame being sent
             self._stop = True
-            self.statusline.stop()
-            self.parent.stop()
+            self.statusline.interrupt()
         elif signum == signal.SIGHUP:
             self.log.info("Received SIGHUP, reloading...")
-            self.statusline.empty()
-            self.parent.stop()
-            self.load()
-            self.setup()
-            time.sleep(0.1)
+            # reload from the main loop, never within a frame being sent
+            self._reload = True
+            self.statusline.interrupt()
+        elif signum == STOP_SIGNAL:
+            self.log.debug("Received stop signal, pausing...")
+            self.statusline.pause()
+            self.parent.engine.pause()
+        elif signum == CONT_SIGNAL:
+            self.log.debug("Received continue signal, resuming...")
+            self.parent.engine.resume()
+            self.statusline.resume()
 
     def run(self):
-        self.statusline.start()
+        if self.is_async:
+            # only imported if used, asyncio takes long to import
+            import asyncio
+            asyncio.run(self.run_async())
+            return
+        self._start()
         time.sleep(0.1)
+        last = 0
+        while not self.should_stop and self.statusline.is_open:
+            # a signal may arrive after the frame cleared the wakeup
+            if self._swap and not self._reload:
+                # poll for the first updates of reloaded blocks
+                if not (self.statusline.wait(SWAP_POLL) or self.swap()):
+                    continue
+            elif not self._reload:
+                self.statusline.wait(self.cfg.interval)
+            if self.should_stop:
+                break
+            # coalesce bursts of updates into a single frame
+            delay = last + self.cfg.frame_spacing - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            if self._reload:
+                self.reload()
+            self.swap()
+            self.statusline.sendline()
+            last = time.monotonic()
+        self.shutdown()
+
+    def run_once(self):
+        """Update every block a single time and print the status line."""
+        self._start_profile()
+        self.parent.engine.run()
+        if self._args.metrics_file:
+            MetricsWriter(self._args.metrics_file, 0, self.metrics).write()
+        if self._args.once == "json":
+            print(self.statusline.frame())
+        else:
+            print(self.statusline.text())
+        self._write_profile()
+
+    def shutdown(self):
+        """End the stream and stop all instances, from the main loop."""
+        self._stop = True
+        if self.statusline.is_open:
+            self.statusline.stop()
+        self.parent.stop()
+
+    def close(self):
+        if self._clicks:
+            self._clicks.stop()
+        if self._metrics:
+            self._metrics.stop()
+        self._write_profile()
+        if isinstance(self.statusline.writer, FrameWriter):
+            self.statusline.writer.close()
+            if self.statusline.writer.dropped:
+                self.log.info("Dropped %d outdated frames",
+                              self.statusline.writer.dropped)
+
+    async def run_async(self):
+        import asyncio
+        self._loop = asyncio.get_running_loop()
+        for signum in SIGNALS:
+            self._loop.add_signal_handler(signum, self.sighandler,
+                                          signum, None)
+        dirty = asyncio.Event()
+        self.statusline.listener = lambda: self._loop.call_soon_threadsafe(
+            dirty.set)
+        self.parent.engine.attach(self._loop)
+        self._install_refresh_signals()
+        self._start()
+        await asyncio.sleep(0.1)
+        last = 0
         while not self.should_stop and self.statusline.is_open:
+            if not (self.statusline.dirty or self._reload):
+                # no keep-alive frames while paused
+                timeout = None if self.statusline.paused else self.cfg.interval
+                if self._swap:
+                    timeout = SWAP_POLL
+                try:
+                    await asyncio.wait_for(dirty.wait(), timeout)
+                except asyncio.TimeoutError:
+                    # poll for the first updates of reloaded blocks
+                    if self._swap and not self.swap():
+                        continue
+            dirty.clear()
+            if self.should_stop:
+                break
+            delay = last + self.cfg.frame_spacing - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if self._reload:
+                self.reload()
+            self.swap()
             self.statusline.sendline()
-            time.sleep(self.cfg.interval)
+            last = time.monotonic()
+        self.shutdown()
 
 
 def main():
     cli = PystatusCli()
     cli.load()
     cli.setup()
+    if cli.once:
+        cli.run_once()
+        return
     cli.run()
+    cli.close()
 
 
 if __name__ == "__main__":
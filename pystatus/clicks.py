@@ -0,0 +1,99 @@
+import codecs
+import json
+import logging
+import os
+from typing import Callable, List
+from pystatus.events import dispatcher
+
+
+class ClickParser:
+    """Incremental parser of the click events i3bar writes to stdin.
+
+    The stream is an endless JSON array with one event object per line,
+    feed() returns all events completed by the given data.
+    """
+
+    def __init__(self):
+        self._log = logging.getLogger("ClickParser")
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder("utf8")("replace")
+        self._buf = ""
+        self._started = False
+
+    @property
+    def log(self) -> logging.Logger:
+        return self._log
+
+    def feed(self, data: bytes) -> List[dict]:
+        events = []
+        buf = self._buf + self._utf8.decode(data)
+        while True:
+            buf = buf.lstrip()
+            if not self._started:
+                if not buf:
+                    break
+                if buf[0] == "[":
+                    buf = buf[1:]
+                self._started = True
+            buf = buf.lstrip(" \t\r\n,")
+            if not buf:
+                break
+            try:
+                event, end = self._decoder.raw_decode(buf)
+            except ValueError:
+                line, sep, rest = buf.partition("\n")
+                if not sep:
+                    # wait for the rest of the event
+                    break
+                self.log.warning("Skipping invalid click event %s", line)
+                buf = rest
+                continue
+            buf = buf[end:]
+            if isinstance(event, dict):
+                events.append(event)
+        self._buf = buf
+        return events
+
+
+class ClickReader:
+    """Reads click events from a file descriptor in the event dispatcher."""
+
+    def __init__(self, fd: int, callback: Callable[[dict], None]):
+        self._fd = fd
+        self._callback = callback
+        self._parser = ClickParser()
+        self._log = logging.getLogger("ClickReader")
+        self._blocking: bool = None
+
+    @property
+    def log(self) -> logging.Logger:
+        return self._log
+
+    def start(self) -> None:
+        self._blocking = os.get_blocking(self._fd)
+        os.set_blocking(self._fd, False)
+        try:
+            dispatcher().register(self._fd, self._on_readable)
+        except OSError as e:
+            # e.g. regular files, which can't be waited for
+            self.log.debug("Not reading click events: %s", e)
+            self.stop()
+
+    def stop(self) -> None:
+        if self._blocking is None:
+            return
+        dispatcher().unregister(self._fd)
+        os.set_blocking(self._fd, self._blocking)
+        self._blocking = None
+
+    def _on_readable(self) -> None:
+        try:
+            data = os.read(self._fd, 4096)
+        except BlockingIOError:
+            return
+        if not data:
+            self.log.debug("End of click events")
+            self.stop()
+            return
+        for event in self._parser.feed(data):
+            self._callback(event)
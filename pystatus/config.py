@@ -1,7 +1,10 @@
+import json
 import logging
 import xml.etree.ElementTree as ET
 from typing import Union, Callable, List, Any
 from pystatus.helpers import lib_path
+from pystatus.engine import ENGINES
+from pystatus.writer import WRITERS
 
 
 def _xml_int(xml: ET.Element) -> int:
@@ -20,6 +23,10 @@ def _xml_bool(xml: ET.Element) -> bool:
     return xml.text.lower() in ["1", "true"]
 
 
+def _xml_list(xml: ET.Element) -> List[str]:
+    return [s.strip() for s in xml.text.split(",") if s.strip()]
+
+
 def _xml_color(xml: ET.Element) -> Union[str, dict]:
     single = _xml_single_color(xml)
     if single:
@@ -54,6 +61,14 @@ class Block:
         "border": (_xml_single_color, False),
         "separator": (_xml_bool, False),
         "separator_block_width": (_xml_int, False),
+        "hysteresis": (_xml_float, False),
+        "adaptive": (_xml_bool, False),
+        "max_interval": (_xml_float, False),
+        "signal": (_xml_int, False),
+        "timeout": (_xml_float, False),
+        "stale_text": (_xml_text, False),
+        "stale_color": (_xml_single_color, False),
+        "stale_urgent": (_xml_bool, False),
     }
 
     _PLUGIN_OPTIONS = {
@@ -80,6 +95,12 @@ class Block:
         if self.plugin in self._PLUGIN_OPTIONS:
             self._check_required(self._PLUGIN_OPTIONS[self.plugin])
 
+    @property
+    def key(self) -> tuple:
+        """Blocks with equal keys are configured the same way."""
+        return (self.plugin.lower(), self.name.lower(), self.interval,
+                json.dumps(self.options(), sort_keys=True, default=repr))
+
     def _check_required(self, d: dict):
         for k, v in d.items():
             if v[1] and not hasattr(self, k):
@@ -105,6 +126,8 @@ class Block:
             return _xml_bool
         elif fn == str:
             return _xml_text
+        elif fn == list:
+            return _xml_list
         return fn
 
     @staticmethod
@@ -128,22 +151,95 @@ class Block:
 class Config:
     def __init__(self):
         self._log = logging.getLogger("Config")
-        self._interval = 1
+        self._interval = None
+        self._frame_spacing = 0.1
+        self._engine = "thread"
+        self._slack = 0.05
+        self._workers = 4
+        self._writer = "blocking"
+        self._click_events = True
         self._plugindir = lib_path("pystatus")
         self._blocks = []
         self._blocks_cfg = None
+        self._plugins = []
 
     @property
     def blocks(self) -> List[Block]:
         return self._blocks
 
     @property
-    def interval(self) -> int:
+    def plugins(self) -> List[str]:
+        """Plugins used by any block, known before load_blocks()."""
+        return self._plugins
+
+    @property
+    def interval(self) -> float:
+        """Maximum time between two frames, None to only send on change."""
         return self._interval
 
     @interval.setter
     def interval(self, value: Any):
-        self._interval = value if isinstance(value, int) else int(value)
+        value = value if isinstance(value, (int, float)) else float(value)
+        self._interval = value if value > 0 else None
+
+    @property
+    def frame_spacing(self) -> float:
+        """Minimum time between two frames."""
+        return self._frame_spacing
+
+    @frame_spacing.setter
+    def frame_spacing(self, value: Any):
+        self._frame_spacing = (value if isinstance(value, float)
+                               else float(value))
+
+    @property
+    def engine(self) -> str:
+        return self._engine
+
+    @engine.setter
+    def engine(self, value: str):
+        value = value.lower()
+        if value not in ENGINES:
+            self.log.critical("Unknown engine %s", value)
+            exit(2)
+        self._engine = value
+
+    @property
+    def slack(self) -> float:
+        return self._slack
+
+    @slack.setter
+    def slack(self, value: Any):
+        self._slack = value if isinstance(value, float) else float(value)
+
+    @property
+    def workers(self) -> int:
+        return self._workers
+
+    @workers.setter
+    def workers(self, value: Any):
+        self._workers = value if isinstance(value, int) else int(value)
+
+    @property
+    def writer(self) -> str:
+        return self._writer
+
+    @writer.setter
+    def writer(self, value: str):
+        value = value.lower()
+        if value not in WRITERS:
+            self.log.critical("Unknown writer %s", value)
+            exit(2)
+        self._writer = value
+
+    @property
+    def click_events(self) -> bool:
+        return self._click_events
+
+    @click_events.setter
+    def click_events(self, value: Any):
+        self._click_events = (value if isinstance(value, bool)
+                              else value.lower() in ["1", "true"])
 
     @property
     def plugindir(self) -> str:
@@ -165,8 +261,12 @@ class Config:
             exit(2)
         for child in root:
             if child.tag == "blocks":
-                # defer block parsing
+                # defer block parsing until their plugins are loaded
                 self._blocks_cfg = child
+                for xml in child:
+                    plugin = (xml.get("plugin") or "").lower()
+                    if plugin and plugin not in self._plugins:
+                        self._plugins.append(plugin)
                 continue
             if hasattr(self, child.tag):
                 setattr(self, child.tag, child.text)
@@ -0,0 +1,365 @@
+import abc
+import functools
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import List
+from pystatus.watchdog import watchdog
+
+
+# seconds to wait for all threads of instances to stop
+STOP_TIMEOUT = 5.0
+# seconds a single update may hold up all blocks of the scheduler engine
+HAND_OVER = 1.0
+
+
+class IEngine(abc.ABC):
+    def __init__(self):
+        self._log = logging.getLogger(type(self).__name__)
+
+    @property
+    def log(self) -> logging.Logger:
+        return self._log
+
+    @abc.abstractmethod
+    def add(self, inst) -> None:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def remove(self, inst) -> None:
+        """Stop and forget a single instance, without waiting for it."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def stop(self) -> None:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def pause(self) -> None:
+        """Stop updating any instance until resume() is called."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def resume(self) -> None:
+        """Update every instance right away and continue as before."""
+        raise NotImplementedError
+
+
+class ThreadEngine(IEngine):
+    """Runs every instance in its own thread."""
+
+    def __init__(self):
+        super().__init__()
+        self._instances = []
+        self._paused = False
+
+    def add(self, inst) -> None:
+        self._instances.append(inst)
+        if self._paused:
+            inst.pause()
+        inst.start()
+
+    def remove(self, inst) -> None:
+        if inst not in self._instances:
+            return
+        self._instances.remove(inst)
+        # the thread closes the instance once its update is done
+        inst.stop(join=False)
+
+    def pause(self) -> None:
+        self._paused = True
+        for inst in self._instances:
+            inst.pause()
+
+    def resume(self) -> None:
+        self._paused = False
+        for inst in self._instances:
+            inst.resume()
+
+    def stop(self) -> None:
+        for inst in self._instances:
+            inst.stop(join=False)
+        deadline = time.monotonic() + STOP_TIMEOUT
+        for inst in self._instances:
+            self.log.debug("Waiting for instance %s to stop", inst.name)
+            inst.join(max(deadline - time.monotonic(), 0))
+            if inst.is_alive():
+                self.log.warning("Instance %s is stuck in its update, not "
+                                 "waiting for it", inst.name)
+        self._instances = []
+
+
+class SchedulerEngine(IEngine):
+    """Drives all non-blocking instances from a single thread.
+
+    Instances are kept in a timer heap keyed by their next due time.
+    Every instance which becomes due within `slack` seconds of the
+    earliest one is updated in the same wakeup. Instances which declare
+    themselves as blocking still get their own thread, so do instances
+    whose update took longer than HAND_OVER seconds or its deadline: the
+    scheduler continues in a new thread and leaves the stuck update to the
+    old one.
+    """
+
+    def __init__(self, slack: float = 0.05):
+        super().__init__()
+        self._slack = slack
+        self._heap = []
+        self._instances = []
+        # removed instances, closed by the scheduler thread
+        self._retired = []
+        # sequence number of the valid heap entry per instance
+        self._due = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._paused = False
+        self._threads = ThreadEngine()
+        # instance being updated by the scheduler thread, and its batch
+        self._current = None
+        self._batch: List[tuple] = []
+        self._thread = self._new_thread()
+
+    @property
+    def slack(self) -> float:
+        return self._slack
+
+    def _new_thread(self) -> threading.Thread:
+        return threading.Thread(target=self._run, name="pystatus_scheduler",
+                                daemon=True)
+
+    def add(self, inst) -> None:
+        if inst.blocking:
+            self.log.debug("Instance %s is blocking, using own thread",
+                           inst.name)
+            self._threads.add(inst)
+            return
+        inst.waker = functools.partial(self.wake, inst)
+        with self._cond:
+            self._instances.append(inst)
+            self._push(time.monotonic(), inst)
+            self._cond.notify()
+        if not self._thread.is_alive():
+            self._thread.start()
+
+    def wake(self, inst) -> None:
+        with self._cond:
+            if inst.stopped:
+                return
+            # replaces the pending entry of this instance
+            self._push(time.monotonic(), inst)
+            self._cond.notify()
+
+    def remove(self, inst) -> None:
+        inst.stop(join=False)
+        with self._cond:
+            if inst in self._instances:
+                self._instances.remove(inst)
+                self._due.pop(inst, None)
+                self._retired.append(inst)
+                self._cond.notify()
+                return
+        # blocking, or moved to its own thread after getting stuck
+        self._threads.remove(inst)
+
+    def _stuck(self, inst) -> None:
+        # called by the watchdog, the update of inst may still be running
+        with self._cond:
+            if self._current is not inst:
+                return
+            self.log.warning("Instance %s is stuck, continuing without it",
+                             inst.name)
+            self._current = None
+            # the rest of the batch is up to the new thread
+            now = time.monotonic()
+            ticked = True
+            for due, _, other in self._batch:
+                if other is inst:
+                    ticked = False
+                elif not (other.stopped or other in self._due):
+                    self._push(other.next_deadline(due, now) if ticked
+                               else due, other)
+            self._batch = []
+            self._thread = self._new_thread()
+            if not self._stopped:
+                self._thread.start()
+            self._cond.notify_all()
+
+    def _hand_over(self, inst) -> None:
+        # the stuck update returned, keep the instance out of our way
+        with self._cond:
+            if inst not in self._instances:
+                # removed or stopped while stuck
+                inst.close()
+                return
+            self._instances.remove(inst)
+            self._due.pop(inst, None)
+        self.log.info("Instance %s continues in its own thread", inst.name)
+        inst.waker = None
+        inst.on_timeout = None
+        self._threads.add(inst)
+
+    def _close_retired(self) -> None:
+        with self._cond:
+            retired, self._retired = self._retired, []
+        for inst in retired:
+            inst.close()
+
+    def pause(self) -> None:
+        with self._cond:
+            self._paused = True
+        self._threads.pause()
+
+    def resume(self) -> None:
+        with self._cond:
+            self._paused = False
+            now = time.monotonic()
+            for inst in self._instances:
+                if not inst.stopped:
+                    self._push(now, inst)
+            self._cond.notify()
+        self._threads.resume()
+
+    def _push(self, due: float, inst) -> None:
+        seq = next(self._seq)
+        self._due[inst] = seq
+        heapq.heappush(self._heap, (due, seq, inst))
+
+    def _is_stale(self, entry: tuple) -> bool:
+        return self._due.get(entry[2]) != entry[1]
+
+    def _next_batch(self) -> List[tuple]:
+        with self._cond:
+            while not self._stopped:
+                if self._retired:
+                    return []
+                if self._paused:
+                    self._cond.wait()
+                    continue
+                while self._heap and self._is_stale(self._heap[0]):
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                now = time.monotonic()
+                delay = self._heap[0][0] - now
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                batch = []
+                limit = now + self._slack
+                while self._heap and self._heap[0][0] <= limit:
+                    entry = heapq.heappop(self._heap)
+                    if self._is_stale(entry):
+                        continue
+                    del self._due[entry[2]]
+                    batch.append(entry)
+                return batch
+        return []
+
+    def _run(self) -> None:
+        me = threading.current_thread()
+        dog = watchdog()
+        while not self._stopped and self._thread is me:
+            self._close_retired()
+            batch = self._batch = self._next_batch()
+            for due, _, inst in batch:
+                if inst.stopped:
+                    continue
+                self._current = inst
+                deadline = HAND_OVER
+                if inst.timeout:
+                    deadline = min(deadline, inst.timeout)
+                dog.call_at(me, time.monotonic() + deadline,
+                            functools.partial(self._stuck, inst))
+                inst.tick()
+                dog.cancel(me)
+                if self._thread is not me:
+                    # replaced by a new thread while inst was stuck
+                    self._hand_over(inst)
+                    return
+                self._current = None
+            now = time.monotonic()
+            with self._cond:
+                if self._thread is not me:
+                    # _stuck() took over the batch right after the update
+                    continue
+                self._batch = []
+                if self._stopped:
+                    self._cond.notify_all()
+                for due, _, inst in batch:
+                    if inst.stopped or inst in self._due:
+                        # stopped or woken up while updating
+                        continue
+                    self._push(inst.next_deadline(due, now), inst)
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopped = True
+            instances, self._instances = self._instances, []
+            for inst in instances:
+                inst.stop(join=False)
+            self._heap = []
+            self._due = {}
+            self._cond.notify()
+        deadline = time.monotonic() + STOP_TIMEOUT
+        with self._cond:
+            # a stuck update may be handed over meanwhile
+            self._cond.wait_for(lambda: self._current is None, STOP_TIMEOUT)
+            stuck, thread = self._current, self._thread
+        if stuck:
+            self.log.warning("Instance %s is stuck in its update, not "
+                             "waiting for it", stuck.name)
+        elif thread.is_alive():
+            thread.join(max(deadline - time.monotonic(), 0))
+        for inst in instances:
+            inst.close()
+        self._threads.stop()
+
+
+class OneShotEngine(IEngine):
+    """Updates every instance a single time from run(), for --once."""
+
+    def __init__(self):
+        super().__init__()
+        self._instances = []
+
+    def add(self, inst) -> None:
+        self._instances.append(inst)
+
+    def remove(self, inst) -> None:
+        if inst in self._instances:
+            self._instances.remove(inst)
+
+    def run(self) -> None:
+        for inst in self._instances:
+            inst.tick()
+            inst.close()
+
+    def stop(self) -> None:
+        self._instances = []
+
+    def pause(self) -> None:
+        pass
+
+    def resume(self) -> None:
+        pass
+
+
+ENGINES = ["thread", "scheduler", "asyncio"]
+
+
+def create_engine(name: str, slack: float = 0.05,
+                  workers: int = 4) -> IEngine:
+    name = name.lower()
+    if name == "thread":
+        return ThreadEngine()
+    elif name == "scheduler":
+        return SchedulerEngine(slack)
+    elif name == "asyncio":
+        # asyncio takes long to import, only do so if it is used
+        from pystatus.asyncengine import AsyncEngine
+        return AsyncEngine(workers)
+    raise ValueError("Unknown engine %s" % name)
@@ -0,0 +1,73 @@
+import logging
+import os
+import selectors
+import threading
+from typing import Callable
+
+
+class Dispatcher(threading.Thread):
+    """Waits for readable file objects and runs their callbacks.
+
+    A single dispatcher thread is shared by all event sources, callbacks
+    are expected to return quickly, e.g. by waking up an instance.
+    """
+
+    def __init__(self):
+        super().__init__(name="pystatus_events", daemon=True)
+        self._log = logging.getLogger("Dispatcher")
+        self._lock = threading.Lock()
+        self._selector = selectors.DefaultSelector()
+        self._rfd, self._wfd = os.pipe()
+        os.set_blocking(self._rfd, False)
+        self._selector.register(self._rfd, selectors.EVENT_READ)
+
+    @property
+    def log(self) -> logging.Logger:
+        return self._log
+
+    def _interrupt(self) -> None:
+        os.write(self._wfd, b"\0")
+
+    def register(self, fileobj, callback: Callable[[], None],
+                 events: int = selectors.EVENT_READ) -> None:
+        with self._lock:
+            self._selector.register(fileobj, events, callback)
+            if not self.is_alive():
+                self.start()
+        self._interrupt()
+
+    def unregister(self, fileobj) -> None:
+        with self._lock:
+            try:
+                self._selector.unregister(fileobj)
+            except (KeyError, ValueError):
+                return
+        self._interrupt()
+
+    def run(self) -> None:
+        while True:
+            ready = self._selector.select()
+            with self._lock:
+                # drop events of file objects unregistered in the meantime
+                callbacks = [key.data for key, _ in ready
+                             if key.fd in self._selector.get_map()]
+            for callback in callbacks:
+                if callback is None:
+                    os.read(self._rfd, 512)
+                    continue
+                try:
+                    callback()
+                except Exception:
+                    self.log.exception("Event callback failed")
+
+
+_dispatcher: Dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def dispatcher() -> Dispatcher:
+    global _dispatcher
+    with _dispatcher_lock:
+        if not _dispatcher:
+            _dispatcher = Dispatcher()
+        return _dispatcher
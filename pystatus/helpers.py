@@ -1,13 +1,18 @@
-from pathlib import Path
 import os
 
 
+# plain os.path, pathlib adds noticeably to the startup time of --once
+
 def config_path(file):
-    return Path.joinpath(Path.home(), ".config", "pystatus", file)
+    return os.path.join(os.path.expanduser("~"), ".config", "pystatus", file)
+
+
+def cache_path(file):
+    return os.path.join(os.path.expanduser("~"), ".cache", "pystatus", file)
 
 
 def lib_path(directory):
-    return Path.joinpath(Path.home(), ".local", "lib", directory)
+    return os.path.join(os.path.expanduser("~"), ".local", "lib", directory)
 
 
 def peek_binary(binary, path=None):
@@ -18,3 +23,11 @@ def peek_binary(binary, path=None):
         if os.path.exists(p):
             return p
     return None
+
+
+def near(value, thresholds, margin=0.1):
+    """Whether value is within margin (relative) of any of thresholds."""
+    if value is None:
+        return False
+    return any(t is not None and abs(value - t) <= abs(t) * margin
+               for t in thresholds)
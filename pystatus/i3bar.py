@@ -2,120 +2,294 @@ import threading
 import json
 import logging
 import io
-from typing import Tuple
+import time
+from operator import attrgetter
+from typing import Any, Callable, Dict, List, Tuple
+from pystatus.metrics import FrameStats
+from pystatus.profiling import Profiler
+
+
+def _indent(indent: int) -> str:
+    return indent if isinstance(indent, str) else " " * indent
+
+
+# (field, default) in serialization order
+FIELDS = (
+    ("name", None),
+    ("instance", None),
+    ("full_text", None),
+    ("short_text", None),
+    ("color", None),
+    ("background", None),
+    ("border", None),
+    ("min_width", None),
+    ("align", "left"),
+    ("urgent", False),
+    ("separator", True),
+    ("separator_block_width", 9),
+    ("markup", "none"),
+)
+# (field, slot, presence bit)
+_LAYOUT = tuple((f, "_" + f, 1 << i) for i, (f, _) in enumerate(FIELDS))
+# field -> (slot, presence bit, default)
+_SLOTS = {f: (slot, bit, d) for (f, slot, bit), (_, d) in zip(_LAYOUT, FIELDS)}
+# field -> position in the values of a snapshot
+_INDEX = {f: i for i, (f, _) in enumerate(FIELDS)}
+_GET_ALL = attrgetter(*(slot for _, slot, _ in _LAYOUT))
+
+
+def _items(mask: int, values: Tuple[Any, ...]) -> Tuple[Tuple[str, Any], ...]:
+    return tuple([(field, value) for (field, _, bit), value
+                  in zip(_LAYOUT, values) if mask & bit])
+
+
+class Snapshot:
+    """Immutable published state of a block."""
+
+    __slots__ = ("_version", "_mask", "_values",
+                 "_fragment", "_fragment_indent")
+
+    def __init__(self, version: int, mask: int, values: Tuple[Any, ...]):
+        self._version = version
+        self._mask = mask
+        self._values = values
+        self._fragment: str = None
+        self._fragment_indent: int = None
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    @property
+    def items(self) -> Tuple[Tuple[str, Any], ...]:
+        return _items(self._mask, self._values)
+
+    @property
+    def fields(self) -> Dict[str, Any]:
+        return dict(self.items)
+
+    def fragment(self, indent: int = None) -> str:
+        """Serialized JSON of this block as element of the status line."""
+        if self._fragment is None or self._fragment_indent != indent:
+            frag = json.dumps(self.fields, indent=indent)
+            if indent is not None:
+                frag = frag.replace("\n", "\n" + _indent(indent))
+            self._fragment = frag
+            self._fragment_indent = indent
+        return self._fragment
 
 
 class Block:
-    def __init__(self, name: str, instance: str):
+    """A single block of the status line.
+
+    Fields live in fixed slots, a bitmask records which of them are set.
+    Unset fields read as their i3bar default and are not serialized.
+    An override replaces some fields in what is published, e.g. while the
+    block is stale, without touching the fields set by its plugin.
+    """
+
+    __slots__ = ("_lock", "_owner", "_notify", "_pending", "_snapshot",
+                 "_mask", "_override") + tuple(slot for _, slot, _ in _LAYOUT)
+
+    def __init__(self, name: str, instance: str,
+                 notify: Callable[[], None] = None):
         self._lock = threading.Lock()
-        self._obj = {
-            "name": name,
-            "instance": instance,
-        }
+        self._owner: int = None
+        self._notify = notify
+        self._pending = False
+        for slot, _, default in _SLOTS.values():
+            setattr(self, slot, default)
+        self._name = name
+        self._instance = instance
+        self._mask = 0b11
+        self._override: Tuple[Tuple[int, int, Any], ...] = None
+        self._snapshot = Snapshot(0, self._mask, _GET_ALL(self))
+
+    def _set(self, key: str, value) -> None:
+        if self._owner != threading.get_ident():
+            with self:
+                self._set(key, value)
+            return
+        # inside a transaction, publish once on release
+        slot, bit, default = _SLOTS[key]
+        if value is None:
+            if not self._mask & bit:
+                return
+            self._mask &= ~bit
+            value = default
+        elif self._mask & bit and getattr(self, slot) == value:
+            return
+        else:
+            self._mask |= bit
+        setattr(self, slot, value)
+        self._pending = True
+
+    def items(self) -> Tuple[Tuple[str, Any], ...]:
+        """All set fields in serialization order."""
+        return _items(self._mask, _GET_ALL(self))
+
+    def _publish(self) -> None:
+        mask, values = self._mask, _GET_ALL(self)
+        if self._override:
+            values = list(values)
+            for index, bit, value in self._override:
+                if value is None:
+                    # hidden, like a field which is not set
+                    mask &= ~bit
+                    continue
+                mask |= bit
+                values[index] = value
+            values = tuple(values)
+        # swapping the reference is atomic, readers never need the lock
+        self._snapshot = Snapshot(self._snapshot.version + 1, mask, values)
+        if self._notify:
+            self._notify()
+
+    @property
+    def overridden(self) -> bool:
+        return self._override is not None
+
+    def override(self, fields: Dict[str, Any],
+                 blocking: bool = True) -> bool:
+        """Publish fields instead of the block's own until override(None).
+
+        Returns False without waiting if blocking is not set and the block
+        is locked.
+        """
+        if not self._lock.acquire(blocking):
+            return False
+        try:
+            if fields:
+                self._override = tuple(
+                    (_INDEX[k], _SLOTS[k][1], v) for k, v in fields.items())
+            elif self._override is None:
+                return True
+            else:
+                self._override = None
+            self._publish()
+        finally:
+            self._lock.release()
+        return True
+
+    @property
+    def snapshot(self) -> Snapshot:
+        return self._snapshot
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
 
     @property
     def name(self) -> str:
-        return self._obj["name"]
+        return self._name
 
     @property
     def instance(self) -> str:
-        return self._obj["instance"]
+        return self._instance
 
     @property
     def full_text(self) -> str:
-        return self._obj["full_text"]
+        return self._full_text
 
     @full_text.setter
     def full_text(self, value: str) -> None:
-        self._obj["full_text"] = value
+        self._set("full_text", value)
 
     @property
     def short_text(self) -> str:
-        return self._obj["short_text"]
+        return self._short_text
 
     @short_text.setter
     def short_text(self, value: str) -> None:
-        self._obj["short_text"] = value
+        self._set("short_text", value)
 
     @property
     def color(self) -> str:
-        return self._obj["color"]
+        return self._color
 
     @color.setter
     def color(self, value: str) -> None:
-        self._obj["color"] = value
+        self._set("color", value)
 
     @property
     def background(self) -> str:
-        return self._obj["background"]
+        return self._background
 
     @background.setter
     def background(self, value: str) -> None:
-        self._obj["background"] = value
+        self._set("background", value)
 
     @property
     def border(self) -> str:
-        return self._obj["border"]
+        return self._border
 
     @border.setter
     def border(self, value: str) -> None:
-        self._obj["border"] = value
+        self._set("border", value)
 
     @property
     def min_width(self) -> str:
-        return self._obj["min_width"]
+        return self._min_width
 
     @min_width.setter
     def min_width(self, value: str) -> None:
-        self._obj["min_width"] = value
+        self._set("min_width", value)
 
     @property
     def align(self) -> str:
-        return self._obj["align"]
+        return self._align
 
     @align.setter
     def align(self, value: str) -> None:
-        self._obj["align"] = value
+        self._set("align", value)
 
     @property
     def urgent(self) -> bool:
-        return self._obj["urgent"]
+        return self._urgent
 
     @urgent.setter
     def urgent(self, value: bool) -> None:
-        self._obj["urgent"] = value
+        self._set("urgent", value)
 
     @property
     def separator(self) -> bool:
-        return self._obj["separator"]
+        return self._separator
 
     @separator.setter
     def separator(self, value: bool) -> None:
-        self._obj["separator"] = value
+        self._set("separator", value)
 
     @property
     def separator_block_width(self) -> int:
-        return self._obj["separator_block_width"]
+        return self._separator_block_width
 
     @separator_block_width.setter
     def separator_block_width(self, value: int) -> None:
-        self._obj["separator_block_width"] = value
+        self._set("separator_block_width", value)
 
     @property
     def markup(self) -> str:
-        return self._obj["markup"]
+        return self._markup
 
     @markup.setter
     def markup(self, value: str) -> None:
-        self._obj["markup"] = value
+        self._set("markup", value)
 
     def lock(self) -> bool:
-        return self._lock.acquire()
+        self._lock.acquire()
+        self._owner = threading.get_ident()
+        return True
 
     __enter__ = lock
 
     def release(self) -> None:
-        self._lock.release()
+        try:
+            if self._pending:
+                self._pending = False
+                self._publish()
+        finally:
+            self._owner = None
+            self._lock.release()
 
     def __exit__(self, t, v, tb) -> None:
         self.release()
@@ -130,12 +304,12 @@ class Block:
         return isinstance(self, type(other)) and self.__key() == other.__key()
 
     def __repr__(self) -> str:
-        return "<Block %s_%s>" % (self["name"], self["instance"])
+        return "<Block %s_%s>" % (self.name, self.instance)
 
 
 class BlockEncoder(json.JSONEncoder):
     def default(self, o):
-        return {k: v for k, v in o._obj.items() if v}
+        return o.snapshot.fields
 
 
 class Statusline:
@@ -145,6 +319,12 @@ class Statusline:
         self._indent = indent
         self._blocks = []
         self._lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._active = threading.Event()
+        self._active.set()
+        self._listener: Callable[[], None] = None
+        self._stats = FrameStats()
+        self._profiler: Profiler = None
         self._log = logging.getLogger("Statusline")
 
     @property
@@ -155,6 +335,12 @@ class Statusline:
     def writer(self) -> io.IOBase:
         return self._writer
 
+    @writer.setter
+    def writer(self, value: io.IOBase) -> None:
+        if self._is_open:
+            raise RuntimeError("can't replace the writer of an open stream")
+        self._writer = value
+
     @property
     def indent(self) -> int:
         return self._indent
@@ -163,35 +349,144 @@ class Statusline:
     def indent(self, value: int) -> None:
         self._indent = value
 
+    @property
+    def dirty(self) -> bool:
+        return self._dirty.is_set()
+
+    @property
+    def stats(self) -> FrameStats:
+        return self._stats
+
+    @property
+    def profiler(self) -> Profiler:
+        return self._profiler
+
+    @profiler.setter
+    def profiler(self, value: Profiler) -> None:
+        self._profiler = value
+
+    @property
+    def listener(self) -> Callable[[], None]:
+        return self._listener
+
+    @listener.setter
+    def listener(self, value: Callable[[], None]) -> None:
+        self._listener = value
+
+    def _changed(self) -> None:
+        self._dirty.set()
+        if self._listener:
+            self._listener()
+
+    @property
+    def paused(self) -> bool:
+        return not self._active.is_set()
+
+    def pause(self) -> None:
+        """Stop sending frames, e.g. while i3bar is hidden."""
+        self._active.clear()
+
+    def resume(self) -> None:
+        """Continue sending frames, starting with a fresh one."""
+        self._active.set()
+        self._changed()
+
+    def wait(self, timeout: float = None) -> bool:
+        """Wait until any block changed. Returns False on timeout.
+
+        While paused this waits without timeout, until resumed or
+        interrupted.
+        """
+        if not self._active.is_set():
+            timeout = None
+        return self._dirty.wait(timeout)
+
+    def interrupt(self) -> None:
+        """Wake up wait(), e.g. to handle a signal outside its handler."""
+        self._changed()
+
     def sendline(self) -> None:
         if not self.is_open:
             return
 
         with self._lock:
-            # first lock all blocks
-            for b in self._blocks:
-                b.lock()
-
-            try:
-                if self._log.getEffectiveLevel == logging.DEBUG:
-                    self._log.debug("Sending status line %s",
-                                    json.dumps(self._blocks, cls=BlockEncoder))
-                json.dump(self._blocks, self.writer,
-                          indent=self.indent, cls=BlockEncoder)
-                self.writer.write(",")
-                self.writer.flush()
-            finally:
-                # make sure every block is released
-                for b in self._blocks:
-                    b.release()
-
-    def new_block(self, plugin: str, instance: str) -> Block:
-        self._log.debug("Creating new block for %s:%s", plugin, instance)
-        block = Block(plugin, instance)
+            # changes published from here on need another frame
+            self._dirty.clear()
+            if not self._active.is_set():
+                # resume() sends a fresh frame anyway
+                return
+            # plugins publish immutable snapshots, so no block lock is needed
+            snapshots = [b.snapshot for b in self._blocks]
+            if self._log.getEffectiveLevel == logging.DEBUG:
+                self._log.debug("Sending status line %s",
+                                json.dumps(self._blocks, cls=BlockEncoder))
+            start = time.monotonic()
+            if self._profiler:
+                frame = self._profiler.scope("serializer", Statusline).call(
+                    self._frame, snapshots) + ","
+            else:
+                frame = self._frame(snapshots) + ","
+            serialized = time.monotonic()
+            self._stats.serialize.observe(serialized - start)
+            if self._profiler:
+                self._profiler.scope("writer", type(self.writer)).call(
+                    self._write, frame)
+            else:
+                self._write(frame)
+            self._stats.write.observe(time.monotonic() - serialized)
+
+    def _write(self, frame: str) -> None:
+        # writers able to drop outdated frames never block
+        write_frame = getattr(self.writer, "write_frame", None)
+        if write_frame:
+            write_frame(frame)
+            return
+        self.writer.write(frame)
+        self.writer.flush()
+
+    def frame(self) -> str:
+        """The current status line as JSON array."""
+        with self._lock:
+            return self._frame([b.snapshot for b in self._blocks])
+
+    def text(self, separator: str = " | ") -> str:
+        """The full texts of all blocks as a single line."""
         with self._lock:
-            self._blocks.append(block)
+            texts = [b.snapshot.fields.get("full_text")
+                     for b in self._blocks]
+        return separator.join(t for t in texts if t)
+
+    def _frame(self, snapshots: List[Snapshot]) -> str:
+        # same output as json.dump(self._blocks, cls=BlockEncoder) but only
+        # blocks which changed since the last frame are serialized again
+        frags = [s.fragment(self.indent) for s in snapshots]
+        if not frags:
+            return "[]"
+        if self.indent is None:
+            return "[" + ", ".join(frags) + "]"
+        newline = "\n" + _indent(self.indent)
+        return "[" + newline + ("," + newline).join(frags) + "\n]"
+
+    @property
+    def blocks(self) -> List[Block]:
+        return list(self._blocks)
+
+    def new_block(self, plugin: str, instance: str,
+                  append: bool = True) -> Block:
+        """Create a block, only shown if append is set or by set_blocks."""
+        self._log.debug("Creating new block for %s:%s", plugin, instance)
+        block = Block(plugin, instance, self._changed)
+        if append:
+            with self._lock:
+                self._blocks.append(block)
         return block
 
+    def set_blocks(self, blocks: List[Block]) -> None:
+        """Replace all blocks at once, the next frame shows the new ones."""
+        with self._lock:
+            self._blocks = list(blocks)
+        self._changed()
+
     def start(self, version: int = 1, stop_signal: int = None,
               cont_signal: int = None, click_events: int = None) -> None:
         if self._is_open:
@@ -216,6 +511,7 @@ class Statusline:
             return
         with self._lock:
             self._blocks = []
+        self._changed()
 
     def stop(self) -> None:
         if not self.is_open:
@@ -225,3 +521,5 @@ class Statusline:
         self.writer.write("[]]")
         self.writer.flush()
         self._is_open = False
+        self._active.set()
+        self._changed()
@@ -1,23 +1,27 @@
-from pystatus.internal import (
-    battery,
-    clock, cpu,
-    disk,
-    loadavg,
-    memory,
-    temperature,
-    uptime,
-    wifi,
-    zfs,
-)
+import importlib
+from typing import Type
 
-PLUGINS = [
-    battery.Battery,
-    clock.Clock, cpu.CPU,
-    disk.Disk,
-    loadavg.Loadavg,
-    memory.Memory,
-    temperature.Temperature,
-    uptime.Uptime,
-    wifi.WifiPlugin,
-    zfs.ZFS,
-]
+
+# plugin name -> (module, class), modules are only imported once used
+PLUGINS = {
+    "battery": ("battery", "Battery"),
+    "clock": ("clock", "Clock"),
+    "cpu": ("cpu", "CPU"),
+    "disk": ("disk", "Disk"),
+    "loadavg": ("loadavg", "Loadavg"),
+    "memory": ("memory", "Memory"),
+    "pystatus": ("selfmon", "Pystatus"),
+    "temperature": ("temperature", "Temperature"),
+    "uptime": ("uptime", "Uptime"),
+    "wifi": ("wifi", "WifiPlugin"),
+    "zfs": ("zfs", "ZFS"),
+}
+
+
+def plugin(name: str) -> Type:
+    """Import the plugin class of an internal plugin, None if unknown."""
+    if name not in PLUGINS:
+        return None
+    module, cls = PLUGINS[name]
+    mod = importlib.import_module("%s.%s" % (__name__, module))
+    return getattr(mod, cls)
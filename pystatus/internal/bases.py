@@ -1,8 +1,24 @@
 import abc
+import functools
 import xml.etree.ElementTree as ET
 from typing import Type
 from humanfriendly import parse_size, format_size
+from pystatus.helpers import near
 from pystatus.plugin import IPlugin, IInstance
+from pystatus.template import Template
+
+
+@functools.lru_cache(maxsize=256)
+def _format_size(size: float) -> str:
+    return format_size(size, binary=True)
+
+
+def _size_step(size: float) -> float:
+    """Step format_size() renders size in, two decimals of its unit."""
+    unit = 1024
+    while size >= unit * 1024 and unit < 1024 ** 8:
+        unit *= 1024
+    return unit / 100 if size >= 1024 else 1
 
 
 class StorAvailPlugin(IPlugin):
@@ -44,6 +60,8 @@ class StorAvailInstance(IInstance):
             options[k] = v
 
         super().__init__(*args, options=options, **kwargs)
+        self._template: Template = None
+        self._shown: float = None
 
     @abc.abstractmethod
     def get_available(self) -> int:
@@ -56,9 +74,24 @@ class StorAvailInstance(IInstance):
             return self._color["warn"]
         return self._color["ok"]
 
+    def near_threshold(self) -> bool:
+        return near(self._shown, (self._threshold_warn, self._threshold_err))
+
     def update(self):
-        avail = self.get_available()
-        text = self._text.format(format_size(avail, binary=True))
+        self.render(self.get_available())
+
+    def render(self, avail: int) -> None:
+        step = _size_step(avail)
+        if (self._shown is not None and abs(avail - self._shown)
+                <= step * (0.5 + self._hysteresis)):
+            return
+        self._shown = round(avail / step) * step
+        if not self._template or self._template.fmt != self._text:
+            # subclasses may set their default text after our __init__
+            self._template = self.template(self._text)
+        text = self._template.render(_format_size(self._shown))
+        if text is None:
+            return
         with self.block:
             self.block.full_text = self.block.short_text = text
-            self.block.color = self.get_color(avail)
+            self.block.color = self.get_color(self._shown)
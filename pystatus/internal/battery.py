@@ -1,4 +1,12 @@
+import os
+from typing import List, Optional, Tuple
+from pystatus.helpers import near
 from pystatus.plugin import IPlugin, IInstance
+from . import sysfs, uevent
+
+
+# attribute pairs to compute the combined charge from, in order of preference
+_LEVELS = (("energy_now", "energy_full"), ("charge_now", "charge_full"))
 
 
 class Battery(IPlugin):
@@ -6,6 +14,8 @@ class Battery(IPlugin):
         super().__init__("battery", "0.1", "g0dscookie", BatteryInstance)
         self.register_option("threshold_warn", int)
         self.register_option("threshold_crit", int)
+        self.register_option("batteries", list)
+        self.register_option("fallback_interval", int)
 
 
 class BatteryInstance(IInstance):
@@ -14,6 +24,8 @@ class BatteryInstance(IInstance):
             "text": "B: {}%",
             "threshold_warn": 30,
             "threshold_crit": 15,
+            "batteries": None,
+            "fallback_interval": 60,
             "color": {
                 "ok": "#ffffff",
                 "warn": "#ffff00",
@@ -22,16 +34,73 @@ class BatteryInstance(IInstance):
             }
         }
         super().__init__(*args, options=options, **kwargs)
+        self._rediscover = False
+        self._template = self.template(self._text)
+        self._value = None
+        self._discover()
+        # with uevents polling is only a safety net for missed events
+        if uevent.monitor().subscribe("power_supply", self._on_uevent):
+            self._interval = max(self._interval, self._fallback_interval)
+
+    def _on_uevent(self, event: dict) -> None:
+        if event.get("ACTION") != "change":
+            # power supplies were added or removed, or events were lost
+            self._rediscover = True
+        self.wake()
+
+    def _discover(self) -> None:
+        batteries = sysfs.power_supplies("Battery")
+        if self._batteries:
+            batteries = {name: path for name, path in batteries.items()
+                         if name in self._batteries}
+        adapters = sysfs.power_supplies("Mains")
+        if not batteries:
+            self.log.warning("No batteries found")
+        self._count = len(batteries)
+
+        # all batteries have to report the same unit to be summed up,
+        # otherwise the mean of their capacity is shown
+        self._level = ("capacity",)
+        for level in _LEVELS:
+            if all(os.path.exists(os.path.join(path, attr))
+                   for path in batteries.values() for attr in level):
+                self._level = level
+                break
 
-    @property
-    def is_charging(self) -> bool:
-        with open("/sys/class/power_supply/ACAD/online", "r") as f:
-            return bool(int(f.read()))
+        paths = [os.path.join(path, "status") for path in batteries.values()]
+        paths += [os.path.join(path, attr) for path in batteries.values()
+                  for attr in self._level]
+        paths += [os.path.join(path, "online") for path in adapters.values()]
+        self._attrs = sysfs.AttributeSet(paths)
 
-    @property
-    def charge(self) -> int:
-        with open("/sys/class/power_supply/BAT1/capacity", "r") as f:
-            return int(f.readline().strip())
+    def read(self) -> Tuple[Optional[int], bool]:
+        """Combined charge in percent and whether any battery charges."""
+        values = self._attrs.read()
+        count, width = self._count, len(self._level)
+        status = values[:count]
+        levels = values[count:count + count * width]
+        online = values[count + count * width:]
+
+        is_charging = "Charging" in status or "1" in online
+        charge = self._charge(levels, width)
+        return charge, is_charging
+
+    @staticmethod
+    def _charge(levels: List[Optional[str]], width: int) -> Optional[int]:
+        if width == 1:
+            capacity = [int(v) for v in levels if v is not None]
+            if not capacity:
+                return None
+            return round(sum(capacity) / len(capacity))
+        now = full = 0
+        for i in range(0, len(levels), width):
+            if levels[i] is None or levels[i + 1] is None:
+                continue
+            now += int(levels[i])
+            full += int(levels[i + 1])
+        if not full:
+            return None
+        return min(100, round(now / full * 100))
 
     def get_color(self, charge: int, is_charging: bool) -> str:
         if is_charging:
@@ -42,10 +111,30 @@ class BatteryInstance(IInstance):
             return self._color["warn"]
         return self._color["ok"]
 
+    def near_threshold(self) -> bool:
+        return near(self._value,
+                    (self._threshold_warn, self._threshold_crit))
+
     def update(self):
-        is_charging = self.is_charging
-        charge = self.charge
-        text = self._text.format(charge)
+        if self._rediscover:
+            self._rediscover = False
+            self._attrs.close()
+            self._discover()
+        charge, is_charging = self.read()
+        self._value = charge
+        if charge is None:
+            self._template.reset()
+            with self.block:
+                self.block.full_text = ""
+                self.block.short_text = None
+            return
+        # the color may change without the text, e.g. on charger connect
+        text = self._template.render(charge) or self._template.text
         with self.block:
             self.block.full_text = self.block.short_text = text
             self.block.color = self.get_color(charge, is_charging)
+
+    def close(self) -> None:
+        uevent.monitor().unsubscribe("power_supply", self._on_uevent)
+        self._attrs.close()
+        super().close()
@@ -1,7 +1,26 @@
+import math
+import re
+import time
 from time import strftime, localtime
 from pystatus.plugin import IPlugin, IInstance
 
 
+# strftime directives which change every second
+_SECONDS = set("sSTXcr")
+_DIRECTIVE = re.compile(r"%[-_0^#EO]*(.)")
+
+
+def resolution(fmt: str) -> int:
+    """Seconds the output of strftime(fmt) stays the same for.
+
+    Anything coarser than minutes is still rendered every minute, so day,
+    DST and time zone changes never show up late.
+    """
+    if any(d in _SECONDS for d in _DIRECTIVE.findall(fmt or "")):
+        return 1
+    return 60
+
+
 class Clock(IPlugin):
     def __init__(self):
         super().__init__("clock", "0.1", "g0dsCookie", ClockInstance)
@@ -14,11 +33,23 @@ class ClockInstance(IInstance):
             "short": "%H:%M:%S",
         }
         super().__init__(*args, options=options, **kwargs)
+        self._resolution = min(resolution(self._text),
+                               resolution(self._short))
+        # tick on the boundaries the output changes at
+        self.align = self._resolution * max(
+            1, math.ceil(self.interval / self._resolution))
+        self._slot: int = None
 
     def update(self):
-        time = localtime()
+        now = time.time()
+        slot = int(now // self._resolution)
+        if slot == self._slot:
+            # woken up in between, the output can't have changed
+            return
+        self._slot = slot
+        local = localtime(now)
         with self.block:
             if self._text:
-                self.block.full_text = strftime(self._text, time)
+                self.block.full_text = strftime(self._text, local)
             if self._short:
-                self.block.short_text = strftime(self._short, time)
+                self.block.short_text = strftime(self._short, local)
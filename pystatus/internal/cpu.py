@@ -1,5 +1,6 @@
-from psutil import cpu_percent, cpu_count
+from pystatus.helpers import near
 from pystatus.plugin import IPlugin, IInstance
+from . import providers  # noqa: F401
 
 
 class CPU(IPlugin):
@@ -21,9 +22,10 @@ class CPUInstance(IInstance):
         }
         super().__init__(*args, options=options, **kwargs)
 
+        self._times = self.subscribe("cpu_times")
         if self._cpu >= 0:
-            count = cpu_count()
-            if self._cpu > count:
+            count = len(self._times.get())
+            if self._cpu >= count:
                 self.log.critical("Unknown cpu core with number %d", self._cpu)
                 exit(2)
         if not self._color:
@@ -33,14 +35,19 @@ class CPUInstance(IInstance):
                 "err": "#ff0000",
             }
 
-        # first call may return 0.0 per documentation
-        # so we simply ignore this
+        self._template = self.template(self._text)
+        self._value = None
+        # the first sample only sets our baseline
         self._get_percent()
 
-    def _get_percent(self) -> int:
+    def _get_percent(self) -> float:
+        delta = self._times.delta()
+        if not delta:
+            return 0.0
+        total, cores = delta
         if self._cpu >= 0:
-            return cpu_percent(percpu=True)[self._cpu]
-        return cpu_percent()
+            return cores[self._cpu]
+        return total
 
     def _get_color(self, perc: int) -> str:
         if perc > self._threshold_err:
@@ -49,9 +56,20 @@ class CPUInstance(IInstance):
             return self._color["warn"]
         return self._color["ok"]
 
+    def near_threshold(self) -> bool:
+        return near(self._value,
+                    (self._threshold_warn, self._threshold_err))
+
     def update(self):
         perc = self._get_percent()
-        text = self._text.format(perc)
+        text = self._template.render(perc)
+        shown = self._template.value()
+        if shown is None:
+            # not shown by the template, the color may change all the same
+            shown, text = perc, self._template.text
+        elif text is None:
+            return
+        self._value = shown
         with self.block:
             self.block.full_text = self.block.short_text = text
-            self.block.color = self._get_color(perc)
+            self.block.color = self._get_color(shown)
@@ -1,6 +1,7 @@
 import os
 import xml.etree.ElementTree as ET
 from .bases import StorAvailPlugin, StorAvailInstance
+from . import providers  # noqa: F401
 
 
 class Disk(StorAvailPlugin):
@@ -36,7 +37,8 @@ class DiskInterface(StorAvailInstance):
             self._dir = self.name.split("_", 1)[1]
         if not self._text:
             self._text = self._dir + ": {}"
+        self._statvfs = self.subscribe("statvfs:%s" % self._dir)
 
     def get_available(self):
-        st = os.statvfs(self._dir)
+        st = self._statvfs.get()
         return st.f_bavail * st.f_frsize
@@ -1,5 +1,5 @@
-from psutil import getloadavg
 from pystatus.plugin import IPlugin, IInstance
+from . import providers  # noqa: F401
 
 
 class Loadavg(IPlugin):
@@ -14,11 +14,21 @@ class LoadavgInstance(IInstance):
             "short": "L: {0:.2f}",
         }
         super().__init__(*args, options=options, **kwargs)
+        self._loadavg = self.subscribe("loadavg")
+        self._text_template = self.template(self._text)
+        self._short_template = self.template(self._short)
 
     def update(self):
-        avg = getloadavg()
+        avg = self._loadavg.get()
+        text = short = None
+        if self._text_template:
+            text = self._text_template.render(*avg)
+        if self._short_template:
+            short = self._short_template.render(*avg)
+        if text is None and short is None:
+            return
         with self.block:
-            if self._text:
-                self.block.full_text = self._text.format(*avg)
-            if self._short:
-                self.block.short_text = self._short.format(*avg)
+            if text is not None:
+                self.block.full_text = text
+            if short is not None:
+                self.block.short_text = short
@@ -1,7 +1,7 @@
 from enum import Enum
 import xml.etree.ElementTree as ET
-from psutil import virtual_memory, swap_memory
 from .bases import StorAvailPlugin, StorAvailInstance
+from . import providers  # noqa: F401
 
 
 class MemorySource(Enum):
@@ -38,6 +38,7 @@ class MemoryInstance(StorAvailInstance):
         }
         super().__init__(*args, options=options, **kwargs)
 
+        self._meminfo = self.subscribe("meminfo")
         mem = self._get_total()
         if not self._threshold_warn:
             self._threshold_warn = mem * 0.4
@@ -46,14 +47,14 @@ class MemoryInstance(StorAvailInstance):
 
     def _get_total(self) -> int:
         if self._source == MemorySource.RAM:
-            return virtual_memory().total
+            return self._meminfo.get().ram_total
         elif self._source == MemorySource.SWAP:
-            return swap_memory().total
+            return self._meminfo.get().swap_total
         raise ValueError("Unknown memory source %s" % self._source)
 
     def get_available(self):
         if self._source == MemorySource.RAM:
-            return virtual_memory().available
+            return self._meminfo.get().ram_available
         elif self._source == MemorySource.SWAP:
-            return virtual_memory().available
+            return self._meminfo.get().swap_free
         raise ValueError("Unknown memory source %s" % self._source)
@@ -0,0 +1,74 @@
+import os
+from collections import namedtuple
+from typing import Dict, List
+
+
+CPUTimes = namedtuple("CPUTimes", ["user", "nice", "system", "idle",
+                                   "iowait", "irq", "softirq", "steal",
+                                   "guest", "guest_nice"])
+
+_CLK_TCK = os.sysconf("SC_CLK_TCK")
+
+# root of the procfs tree, may be pointed to a fake tree
+PROCFS = "/proc"
+
+
+class ProcFile:
+    """A procfs file kept open and re-read with pread into a reused buffer."""
+
+    def __init__(self, path: str, size: int = 4096):
+        self._path = path
+        self._fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+        self._buf = bytearray(size)
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def read(self) -> bytes:
+        while True:
+            n = os.preadv(self._fd, [self._buf], 0)
+            if n < len(self._buf):
+                return bytes(memoryview(self._buf)[:n])
+            # the file didn't fit, grow the buffer and read it again
+            self._buf = bytearray(len(self._buf) * 2)
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class Stat(ProcFile):
+    def __init__(self):
+        super().__init__(os.path.join(PROCFS, "stat"))
+
+    def cpu_times(self) -> List[CPUTimes]:
+        """Per core cpu times in seconds, like psutil.cpu_times(True)."""
+        cores = []
+        for line in self.read().split(b"\n")[1:]:
+            if not line.startswith(b"cpu"):
+                break
+            fields = line.split()[1:11]
+            fields += [b"0"] * (10 - len(fields))
+            cores.append(CPUTimes(*[int(f) / _CLK_TCK for f in fields]))
+        return cores
+
+
+class MemInfo(ProcFile):
+    def __init__(self):
+        super().__init__(os.path.join(PROCFS, "meminfo"))
+
+    def fields(self, *names: bytes) -> Dict[bytes, int]:
+        """Requested fields in bytes, missing ones are left out."""
+        wanted = set(names)
+        values = {}
+        for line in self.read().split(b"\n"):
+            name, _, rest = line.partition(b":")
+            if name in wanted:
+                # values are given in kB
+                values[name] = int(rest.split()[0]) * 1024
+                if len(values) == len(wanted):
+                    break
+        return values
+
@@ -0,0 +1,181 @@
+import logging
+import os
+import time
+from collections import namedtuple
+from typing import Callable, List, Tuple
+from pystatus.plugin import IProvider, providers
+from . import procfs
+
+
+MemInfo = namedtuple("MemInfo", ["ram_total", "ram_available",
+                                 "swap_total", "swap_free"])
+
+
+def _cpu_busy(times) -> Tuple[float, float]:
+    """Returns (busy, total) like psutil.cpu_percent() computes them."""
+    total = sum(times)
+    # guest time is already accounted in user time
+    total -= getattr(times, "guest", 0) + getattr(times, "guest_nice", 0)
+    idle = times.idle + getattr(times, "iowait", 0)
+    return total - idle, total
+
+
+def _cpu_sum(percpu: List[tuple]) -> tuple:
+    return type(percpu[0])(*map(sum, zip(*percpu)))
+
+
+def _cpu_percent(prev, cur) -> float:
+    prev_busy, prev_total = _cpu_busy(prev)
+    cur_busy, cur_total = _cpu_busy(cur)
+    total = cur_total - prev_total
+    if total <= 0:
+        return 0.0
+    return max(0.0, min(100.0, (cur_busy - prev_busy) / total * 100))
+
+
+class CPUTimesProvider(IProvider):
+    """Per core cpu times, the delta is (total, [per core]) in percent."""
+
+    def __init__(self, arg: str = None):
+        super().__init__("cpu_times")
+
+    def delta(self, prev: List[tuple], cur: List[tuple]) -> tuple:
+        cores = [_cpu_percent(p, c) for p, c in zip(prev, cur)]
+        total = _cpu_percent(_cpu_sum(prev), _cpu_sum(cur))
+        return total, cores
+
+
+# psutil backend, only imported if no other backend is available
+
+class PsutilCPUTimesProvider(CPUTimesProvider):
+    def __init__(self, arg: str = None):
+        super().__init__(arg)
+        from psutil import cpu_times
+        self._cpu_times = cpu_times
+
+    def sample(self) -> List[tuple]:
+        return self._cpu_times(percpu=True)
+
+
+class PsutilMemInfoProvider(IProvider):
+    def __init__(self, arg: str = None):
+        super().__init__("meminfo")
+        from psutil import swap_memory, virtual_memory
+        self._virtual_memory = virtual_memory
+        self._swap_memory = swap_memory
+
+    def sample(self) -> MemInfo:
+        ram, swap = self._virtual_memory(), self._swap_memory()
+        return MemInfo(ram.total, ram.available, swap.total, swap.free)
+
+
+class PsutilLoadavgProvider(IProvider):
+    def __init__(self, arg: str = None):
+        super().__init__("loadavg")
+        from psutil import getloadavg
+        self._getloadavg = getloadavg
+
+    def sample(self) -> Tuple[float, float, float]:
+        return self._getloadavg()
+
+
+class PsutilUptimeProvider(IProvider):
+    """Seconds since boot."""
+
+    def __init__(self, arg: str = None):
+        super().__init__("uptime")
+        from psutil import boot_time
+        self._boot_time = boot_time()
+
+    def sample(self) -> float:
+        return time.time() - self._boot_time
+
+
+# procfs backend
+
+class ProcCPUTimesProvider(CPUTimesProvider):
+    def __init__(self, arg: str = None):
+        super().__init__(arg)
+        self._stat = procfs.Stat()
+
+    def sample(self) -> List[procfs.CPUTimes]:
+        return self._stat.cpu_times()
+
+
+class ProcMemInfoProvider(IProvider):
+    FIELDS = (b"MemTotal", b"MemAvailable", b"MemFree", b"Buffers",
+              b"Cached", b"SwapTotal", b"SwapFree")
+
+    def __init__(self, arg: str = None):
+        super().__init__("meminfo")
+        self._meminfo = procfs.MemInfo()
+
+    def sample(self) -> MemInfo:
+        f = self._meminfo.fields(*self.FIELDS)
+        available = f.get(b"MemAvailable")
+        if available is None:
+            # kernels before 3.14 don't provide an estimate
+            available = f[b"MemFree"] + f[b"Buffers"] + f[b"Cached"]
+        return MemInfo(f[b"MemTotal"], available,
+                       f[b"SwapTotal"], f[b"SwapFree"])
+
+
+# os backend, cheaper than reading procfs
+
+class OSLoadavgProvider(IProvider):
+    def __init__(self, arg: str = None):
+        super().__init__("loadavg")
+        # fails right away where the load average can't be obtained
+        os.getloadavg()
+
+    def sample(self) -> Tuple[float, float, float]:
+        return os.getloadavg()
+
+
+class BoottimeUptimeProvider(IProvider):
+    """Seconds since boot, including time suspended like /proc/uptime."""
+
+    def __init__(self, arg: str = None):
+        super().__init__("uptime")
+        self._clock = time.CLOCK_BOOTTIME
+
+    def sample(self) -> float:
+        return time.clock_gettime(self._clock)
+
+
+class StatVFSProvider(IProvider):
+    def __init__(self, path: str):
+        super().__init__("statvfs:%s" % path)
+        self._path = path
+
+    def sample(self) -> os.statvfs_result:
+        return os.statvfs(self._path)
+
+
+def _first_available(*factories: Callable[[str], IProvider]
+                     ) -> Callable[[str], IProvider]:
+    """Factory trying each backend in turn, the last one is the fallback.
+
+    Backends not available on this system, e.g. a procfs file which can't
+    be opened in a container, fail with OSError or AttributeError.
+    """
+    def create(arg: str) -> IProvider:
+        for factory in factories[:-1]:
+            try:
+                return factory(arg)
+            except (OSError, AttributeError) as e:
+                logging.getLogger("ProviderRegistry").debug(
+                    "%s not available: %s", factory.__name__, e)
+        return factories[-1](arg)
+    return create
+
+
+providers.register("cpu_times", _first_available(ProcCPUTimesProvider,
+                                                 PsutilCPUTimesProvider))
+providers.register("meminfo", _first_available(ProcMemInfoProvider,
+                                               PsutilMemInfoProvider))
+providers.register("loadavg", _first_available(OSLoadavgProvider,
+                                               PsutilLoadavgProvider))
+providers.register("uptime", _first_available(BoottimeUptimeProvider,
+                                              PsutilUptimeProvider))
+providers.register("statvfs", StatVFSProvider)
@@ -0,0 +1,44 @@
+import time
+from pystatus.metrics import process_usage
+from pystatus.plugin import IPlugin, IInstance
+
+
+class Pystatus(IPlugin):
+    def __init__(self):
+        super().__init__("pystatus", "0.1", "g0dsCookie", PystatusInstance)
+
+
+class PystatusInstance(IInstance):
+    """CPU usage and resident memory of pystatus itself."""
+
+    def __init__(self, *args, **kwargs):
+        options = {
+            "text": "PY: {cpu:.1f}% {rss:.1f}M",
+            "short": "PY: {cpu:.1f}%",
+        }
+        super().__init__(*args, options=options, **kwargs)
+        self._text_template = self.template(self._text)
+        self._short_template = self.template(self._short)
+        # the first sample only sets our baseline
+        self._prev = (time.monotonic(), process_usage()[0])
+
+    def update(self):
+        now = time.monotonic()
+        cpu_time, rss = process_usage()
+        prev, self._prev = self._prev, (now, cpu_time)
+        if now <= prev[0]:
+            return
+        cpu = (cpu_time - prev[1]) / (now - prev[0]) * 100
+        rss /= 1024 * 1024
+        text = short = None
+        if self._text_template:
+            text = self._text_template.render(cpu=cpu, rss=rss)
+        if self._short_template:
+            short = self._short_template.render(cpu=cpu, rss=rss)
+        if text is None and short is None:
+            return
+        with self.block:
+            if text is not None:
+                self.block.full_text = text
+            if short is not None:
+                self.block.short_text = short
@@ -0,0 +1,111 @@
+import os
+import re
+from typing import Dict, List, Optional
+from .procfs import ProcFile
+
+
+# root of the sysfs tree, may be pointed to a fake tree
+SYSFS = "/sys"
+
+_TEMP_INPUT = re.compile(r"^temp(\d+)_input$")
+
+
+class Attribute(ProcFile):
+    """A sysfs attribute kept open, every read returns its current value."""
+
+    def __init__(self, path: str):
+        super().__init__(path, 128)
+
+    def text(self) -> str:
+        return self.read().decode("utf8", "replace").strip()
+
+
+class AttributeSet:
+    """Attributes read together in a single pass.
+
+    Attributes which are missing or fail to read, e.g. the ones of a removed
+    battery, read as None and are opened again on the next read.
+    """
+
+    def __init__(self, paths: List[str]):
+        self._paths = list(paths)
+        self._attrs: List[Optional[Attribute]] = [None] * len(self._paths)
+
+    @property
+    def paths(self) -> List[str]:
+        return self._paths
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+    def read(self) -> List[Optional[str]]:
+        values = []
+        for i, attr in enumerate(self._attrs):
+            try:
+                if attr is None:
+                    attr = self._attrs[i] = Attribute(self._paths[i])
+                values.append(attr.text())
+            except OSError:
+                if attr is not None:
+                    attr.close()
+                    self._attrs[i] = None
+                values.append(None)
+        return values
+
+    def close(self) -> None:
+        for attr in self._attrs:
+            if attr is not None:
+                attr.close()
+        self._attrs = [None] * len(self._paths)
+
+
+def read_attribute(path: str) -> Optional[str]:
+    """Read a single attribute once, e.g. while discovering devices."""
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def class_devices(cls: str) -> Dict[str, str]:
+    """Devices of /sys/class/CLS by name."""
+    path = os.path.join(SYSFS, "class", cls)
+    try:
+        names = sorted(os.listdir(path))
+    except OSError:
+        return {}
+    return {name: os.path.join(path, name) for name in names}
+
+
+def power_supplies(kind: str) -> Dict[str, str]:
+    """Power supplies of the given type, e.g. Battery or Mains."""
+    return {name: path for name, path in class_devices("power_supply").items()
+            if read_attribute(os.path.join(path, "type")) == kind}
+
+
+def hwmon_temperatures() -> Dict[str, str]:
+    """Temperature inputs of all hwmon devices by "chip/label"."""
+    sensors = {}
+    for dev, path in class_devices("hwmon").items():
+        chip = read_attribute(os.path.join(path, "name")) or dev
+        # older drivers put their attributes below device/
+        for base in (path, os.path.join(path, "device")):
+            try:
+                files = os.listdir(base)
+            except OSError:
+                continue
+            inputs = []
+            for f in files:
+                m = _TEMP_INPUT.match(f)
+                if m:
+                    inputs.append((int(m.group(1)), f))
+            for num, f in sorted(inputs):
+                label = (read_attribute(os.path.join(base, "temp%d_label"
+                                                     % num))
+                         or "temp%d" % num)
+                key = "%s/%s" % (chip, label)
+                if key in sensors:
+                    key = "%s/%s" % (dev, label)
+                sensors[key] = os.path.join(base, f)
+    return sensors
@@ -1,13 +1,17 @@
+import fnmatch
 import os
 import xml.etree.ElementTree as ET
+from pystatus.helpers import near
 from pystatus.plugin import IPlugin, IInstance
+from . import sysfs
 
 
 class Temperature(IPlugin):
     def __init__(self):
         super().__init__("temperature", "0.1",
                          "g0dscookie", TemperatureInstance)
-        self.register_option("path", self._check_path, required=True)
+        self.register_option("path", self._check_path)
+        self.register_option("sensors", list)
         self.register_option("threshold_warn", float)
         self.register_option("threshold_err", float)
 
@@ -24,6 +28,7 @@ class TemperatureInstance(IInstance):
         options = {
             "text": "T: {:.0f}°C",
             "path": None,
+            "sensors": ["*"],
             "threshold_warn": 40,
             "threshold_err": 50,
             "color": {
@@ -33,10 +38,27 @@ class TemperatureInstance(IInstance):
             },
         }
         super().__init__(*args, options=options, **kwargs)
+        self._attrs = sysfs.AttributeSet(self._discover())
+        self._template = self.template(self._text)
+        self._value = None
+
+    def _discover(self) -> list:
+        if self._path:
+            return [self._path]
+        sensors = sysfs.hwmon_temperatures()
+        paths = [path for name, path in sensors.items()
+                 if any(fnmatch.fnmatch(name, p) for p in self._sensors)]
+        if not paths:
+            self.log.warning("No temperature sensors matching %s found",
+                             ", ".join(self._sensors))
+        return paths
 
     def read_temp(self) -> float:
-        with open(self._path, "r") as f:
-            return int(f.readline().strip()) / 1000
+        """Highest temperature over all sensors, None if none is readable."""
+        temps = [int(v) for v in self._attrs.read() if v]
+        if not temps:
+            return None
+        return max(temps) / 1000
 
     def get_color(self, temp) -> str:
         if temp >= self._threshold_err:
@@ -45,9 +67,31 @@ class TemperatureInstance(IInstance):
             return self._color["warn"]
         return self._color["ok"]
 
+    def near_threshold(self) -> bool:
+        return near(self._value,
+                    (self._threshold_warn, self._threshold_err))
+
     def update(self):
         temp = self.read_temp()
-        text = self._text.format(temp)
+        if temp is None:
+            self._template.reset()
+            self._value = None
+            with self.block:
+                self.block.full_text = ""
+                self.block.short_text = None
+            return
+        text = self._template.render(temp)
+        shown = self._template.value()
+        if shown is None:
+            # not shown by the template, the color may change all the same
+            shown, text = temp, self._template.text
+        elif text is None:
+            return
+        self._value = shown
         with self.block:
             self.block.full_text = self.block.short_text = text
-            self.block.color = self.get_color(temp)
+            self.block.color = self.get_color(shown)
+
+    def close(self) -> None:
+        self._attrs.close()
+        super().close()
@@ -0,0 +1,127 @@
+import errno
+import logging
+import socket
+import threading
+from typing import Callable, Dict, List
+from pystatus.events import dispatcher
+
+
+NETLINK_KOBJECT_UEVENT = 15
+# multicast group of the events sent by the kernel itself
+_KERNEL_GROUP = 1
+
+Callback = Callable[[Dict[str, str]], None]
+
+
+def netlink_socket() -> socket.socket:
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM,
+                         NETLINK_KOBJECT_UEVENT)
+    try:
+        sock.bind((0, _KERNEL_GROUP))
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def parse(msg: bytes) -> Dict[str, str]:
+    """Parse a kernel uevent "ACTION@DEVPATH\\0KEY=VALUE\\0...".
+
+    Returns None for anything else, e.g. messages of udevd.
+    """
+    header, *env = msg.split(b"\0")
+    if b"@" not in header:
+        return None
+    event = {}
+    for line in env:
+        key, sep, value = line.partition(b"=")
+        if sep:
+            event[key.decode("utf8", "replace")] = value.decode(
+                "utf8", "replace")
+    return event
+
+
+class UeventMonitor:
+    """Kernel uevents dispatched to subscribers by subsystem.
+
+    The socket is created by socket_factory when the first subscriber is
+    added, tests may pass one end of a socketpair to inject events.
+    """
+
+    def __init__(self, socket_factory: Callable[[], socket.socket] = None):
+        self._log = logging.getLogger("UeventMonitor")
+        self._factory = socket_factory or netlink_socket
+        self._lock = threading.Lock()
+        self._sock: socket.socket = None
+        self._subscribers: Dict[str, List[Callback]] = {}
+
+    @property
+    def log(self) -> logging.Logger:
+        return self._log
+
+    def subscribe(self, subsystem: str, callback: Callback) -> bool:
+        """Returns False if uevents are not available."""
+        with self._lock:
+            if not self._sock:
+                try:
+                    sock = self._factory()
+                except OSError as e:
+                    self.log.warning("Failed to listen for uevents: %s", e)
+                    return False
+                sock.setblocking(False)
+                self._sock = sock
+                dispatcher().register(sock, self._on_readable)
+            self._subscribers.setdefault(subsystem, []).append(callback)
+        return True
+
+    def unsubscribe(self, subsystem: str, callback: Callback) -> None:
+        with self._lock:
+            callbacks = self._subscribers.get(subsystem, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks:
+                self._subscribers.pop(subsystem, None)
+            if self._subscribers or not self._sock:
+                return
+            dispatcher().unregister(self._sock)
+            self._sock.close()
+            self._sock = None
+
+    def _on_readable(self) -> None:
+        while True:
+            with self._lock:
+                if not self._sock:
+                    return
+                try:
+                    event = parse(self._sock.recv(8192))
+                except BlockingIOError:
+                    return
+                except OSError as e:
+                    if e.errno != errno.ENOBUFS:
+                        raise
+                    # the kernel dropped events, notify everyone with an
+                    # empty event so they can re-read their state
+                    self.log.warning("uevent queue overflowed")
+                    event = {}
+                if event is None:
+                    continue
+                if event:
+                    callbacks = list(self._subscribers.get(
+                        event.get("SUBSYSTEM"), []))
+                else:
+                    callbacks = [cb for cbs in self._subscribers.values()
+                                 for cb in cbs]
+            for callback in callbacks:
+                callback(event)
+
+
+_monitor: UeventMonitor = None
+_monitor_lock = threading.Lock()
+
+
+def monitor() -> UeventMonitor:
+    global _monitor
+    with _monitor_lock:
+        if not _monitor:
+            _monitor = UeventMonitor()
+        return _monitor
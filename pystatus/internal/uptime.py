@@ -1,7 +1,6 @@
-from datetime import datetime, timedelta
-from time import time
-from psutil import boot_time
+from datetime import timedelta
 from pystatus.plugin import IPlugin, IInstance
+from . import providers  # noqa: F401
 
 
 class Uptime(IPlugin):
@@ -13,12 +12,18 @@ class UptimeInstance(IInstance):
     def __init__(self, *args, **kwargs):
         options = {"text": "U: %s"}
         super().__init__(*args, options=options, **kwargs)
+        self._uptime = self.subscribe("uptime")
+        self._last: timedelta = None
 
     def _get_uptime(self) -> timedelta:
-        current = datetime.fromtimestamp(int(time()))
-        return current - datetime.fromtimestamp(boot_time())
+        return timedelta(seconds=int(self._uptime.get()))
 
     def update(self):
+        uptime = self._get_uptime()
+        if uptime == self._last:
+            # only whole seconds are shown
+            return
+        self._last = uptime
         with self.block:
             self.block.full_text = self.block.short_text \
-                = self._text % self._get_uptime()
+                = self._text % uptime
@@ -1,8 +1,19 @@
+import os
 import re
-from subprocess import Popen, PIPE
+import threading
+import time
 import xml.etree.ElementTree as ET
 from pystatus.plugin import IPlugin, IInstance
 from pystatus.helpers import peek_binary
+from pystatus.process import communicate
+from pystatus.events import dispatcher
+from .wpactrl import WpaCtrl, WpaMonitor
+
+
+# seconds until connecting to wpa_supplicant is tried again, doubled per
+# failed attempt
+RECONNECT = 1.0
+MAX_RECONNECT = 60.0
 
 
 class WifiPlugin(IPlugin):
@@ -11,19 +22,32 @@ class WifiPlugin(IPlugin):
         self.register_option("text", self._text)
         self.register_option("iface", str)
         self.register_option("wpa_cli", str)
+        self.register_option("ctrl_dir", str)
 
     def _text(self, xml: ET.Element) -> dict:
         return dict({child.tag: child.text for child in xml})
 
 
 class WifiInstance(IInstance):
+    blocking = True
     RE_STATUS = re.compile(r"^([^=]+)=(.*)$")
+    # events which may change the status of the interface
+    EVENTS = (
+        "CTRL-EVENT-CONNECTED",
+        "CTRL-EVENT-DISCONNECTED",
+        "CTRL-EVENT-SCAN-STARTED",
+        "CTRL-EVENT-SSID-TEMP-DISABLED",
+        "CTRL-EVENT-TERMINATING",
+        "Trying to associate",
+        "Associated with",
+    )
 
     def __init__(self, *args, **kwargs):
         options = {
             "text": None,
             "wpa_cli": None,
             "iface": None,
+            "ctrl_dir": "/var/run/wpa_supplicant",
             "color": {
                 "default": "#ffffff",
                 "completed": "#00ff00",
@@ -41,19 +65,144 @@ class WifiInstance(IInstance):
                 "default": self._iface + ": {wpa_state}",
                 "completed": self._iface + ": {ssid}",
             }
+        self._templates = {state: self.template(text)
+                           for state, text in self._text.items()}
+        self._state: str = None
+
+        # guards swapping the connections, never held during requests
+        self._lock = threading.Lock()
+        self._ctrl: WpaCtrl = None
+        self._monitor: WpaMonitor = None
+        # set by the event thread, the update closes the connection then
+        self._lost = False
+        self._reconnect = 0.0
+        self._reconnect_at = 0.0
+        self._open_ctrl()
+
         if not self._wpa_cli:
             self._wpa_cli = peek_binary("wpa_cli")
-            if not self._wpa_cli:
+            if not self._wpa_cli and not self._ctrl:
                 self.log.critical("Could not find 'wpa_cli'")
                 exit(2)
 
-    def _wifi_status(self):
-        p = Popen([self._wpa_cli, "-i", self._iface, "status"],
-                  stdin=PIPE, stdout=PIPE, stderr=PIPE)
-        (stdout, stderr) = p.communicate()
-        if p.returncode != 0:
+    def _ctrl_path(self) -> str:
+        path = os.path.join(self._ctrl_dir, self._iface)
+        return path if os.path.exists(path) else None
+
+    def _open_ctrl(self) -> None:
+        path = self._ctrl_path()
+        if not path:
+            return
+        ctrl, monitor = WpaCtrl(path), WpaMonitor(path)
+        try:
+            ctrl.open()
+            monitor.open()
+        except OSError as e:
+            self._failed_ctrl(ctrl, e)
+            return
+        self._opened_ctrl(ctrl, monitor)
+
+    async def _aopen_ctrl(self) -> None:
+        path = self._ctrl_path()
+        if not path:
+            return
+        ctrl, monitor = WpaCtrl(path), WpaMonitor(path)
+        try:
+            ctrl.open()
+            await monitor.aopen()
+        except OSError as e:
+            self._failed_ctrl(ctrl, e)
+            return
+        self._opened_ctrl(ctrl, monitor)
+
+    def _opened_ctrl(self, ctrl: WpaCtrl, monitor: WpaMonitor) -> None:
+        self.log.debug("Connected to %s", ctrl.path)
+        self._reconnect = 0.0
+        self._lost = False
+        with self._lock:
+            self._ctrl, self._monitor = ctrl, monitor
+        dispatcher().register(monitor, self._on_event)
+
+    def _failed_ctrl(self, ctrl: WpaCtrl, e: OSError) -> None:
+        ctrl.close()
+        self._back_off()
+        self.log.warn("Could not connect to %s, using wpa_cli for %.0fs: "
+                      "%s", ctrl.path, self._reconnect, e)
+
+    def _back_off(self) -> None:
+        self._reconnect = min(max(self._reconnect * 2, RECONNECT),
+                              MAX_RECONNECT)
+        self._reconnect_at = time.monotonic() + self._reconnect
+
+    def _close_monitor(self) -> None:
+        with self._lock:
+            monitor, self._monitor = self._monitor, None
+        if monitor:
+            dispatcher().unregister(monitor)
+            monitor.close()
+
+    def _close_ctrl(self) -> None:
+        with self._lock:
+            ctrl, self._ctrl = self._ctrl, None
+        self._close_monitor()
+        self._lost = False
+        if ctrl:
+            ctrl.close()
+
+    def _on_event(self) -> None:
+        monitor = self._monitor
+        if not monitor:
+            return
+        try:
+            event = monitor.event()
+        except OSError as e:
+            self.log.warn("Lost connection to wpa_supplicant: %s", e)
+            self._lose_ctrl()
+            self.wake()
+            return
+        self.log.debug("Received event %s", event)
+        if event.startswith("CTRL-EVENT-TERMINATING"):
+            self._lose_ctrl()
+        if event.startswith(self.EVENTS):
+            self.wake()
+
+    def _lose_ctrl(self) -> None:
+        # the update may be using the control connection right now, so it
+        # closes the connection itself
+        self._close_monitor()
+        self._lost = True
+
+    async def _ctrl_status(self) -> dict:
+        if self._lost:
+            self._close_ctrl()
+        ctrl = self._ctrl
+        if not ctrl:
+            if time.monotonic() < self._reconnect_at:
+                return None
+            await self._aopen_ctrl()
+            ctrl = self._ctrl
+            if not ctrl:
+                return None
+        try:
+            return await ctrl.astatus()
+        except OSError as e:
+            self.log.warn("STATUS request failed: %s", e)
+            self._close_ctrl()
+            self._back_off()
+            return None
+
+    def close(self) -> None:
+        self._close_ctrl()
+        super().close()
+
+    async def _wifi_status(self):
+        if not self._wpa_cli:
+            return {}
+        (returncode, stdout, stderr) = await communicate(
+            self._wpa_cli, "-i", self._iface, "status")
+        if returncode != 0:
             self.log.critical("Got non-zero exit code from wpa_cli: %d | %s",
-                              p.returncode, stderr.decode("utf8"))
+                              returncode, stderr.decode("utf8"))
             return {}
         status = {}
         for line in stdout.decode("utf8").split("\n"):
@@ -66,11 +215,21 @@ class WifiInstance(IInstance):
             status[match.group(1)] = match.group(2)
         return status
 
-    def update(self):
-        status = self._wifi_status()
+    async def update(self):
+        status = await self._ctrl_status()
+        if status is None:
+            status = await self._wifi_status()
+        status.setdefault("wpa_state", "unknown")
         wpa_state = status["wpa_state"].lower()
-        text = (self._text[wpa_state] if wpa_state in self._text else
-                self._text["default"]).format_map(status)
+        template = (self._templates[wpa_state]
+                    if wpa_state in self._templates
+                    else self._templates["default"])
+        if wpa_state != self._state:
+            self._state = wpa_state
+            template.reset()
+        text = template.render(**status)
+        if text is None:
+            return
         color = (self._color[wpa_state] if wpa_state in self._color else
                  self._color["default"])
 
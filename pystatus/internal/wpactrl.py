@@ -0,0 +1,143 @@
+import itertools
+import os
+import socket
+import tempfile
+from typing import Dict
+
+
+class WpaCtrl:
+    """Client for the control interface of wpa_supplicant.
+
+    Talks to the unix datagram socket wpa_supplicant creates for every
+    interface, the same way wpa_cli does.
+    """
+
+    _counter = itertools.count()
+
+    def __init__(self, path: str, timeout: float = 1.0):
+        self._path = path
+        self._timeout = timeout
+        self._local: str = None
+        self._sock: socket.socket = None
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def is_open(self) -> bool:
+        return self._sock is not None
+
+    def fileno(self) -> int:
+        return self._sock.fileno()
+
+    def open(self) -> None:
+        local = os.path.join(tempfile.gettempdir(), "pystatus_wpa_%d-%d"
+                             % (os.getpid(), next(WpaCtrl._counter)))
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            sock.bind(local)
+            sock.connect(self._path)
+        except OSError:
+            sock.close()
+            if os.path.exists(local):
+                os.unlink(local)
+            raise
+        sock.settimeout(self._timeout)
+        self._sock = sock
+        self._local = local
+
+    def close(self) -> None:
+        if not self._sock:
+            return
+        self._sock.close()
+        self._sock = None
+        try:
+            os.unlink(self._local)
+        except OSError:
+            pass
+
+    def request(self, cmd: str) -> str:
+        self._sock.send(cmd.encode("utf8"))
+        while True:
+            reply = self._sock.recv(4096).decode("utf8", "replace")
+            # skip unsolicited events, they start with their level "<N>"
+            if not reply.startswith("<"):
+                return reply
+
+    async def arequest(self, cmd: str) -> str:
+        """Like request(), without blocking the running event loop."""
+        # only imported if used, asyncio takes long to import
+        import asyncio
+        loop = asyncio.get_running_loop()
+        self._sock.setblocking(False)
+        try:
+            await loop.sock_sendall(self._sock, cmd.encode("utf8"))
+            while True:
+                data = await asyncio.wait_for(
+                    loop.sock_recv(self._sock, 4096), self._timeout)
+                reply = data.decode("utf8", "replace")
+                if not reply.startswith("<"):
+                    return reply
+        except asyncio.TimeoutError:
+            # an OSError like the timeout of request()
+            raise socket.timeout("timed out")
+        finally:
+            if self._sock:
+                self._sock.settimeout(self._timeout)
+
+    @staticmethod
+    def _parse_status(reply: str) -> Dict[str, str]:
+        status = {}
+        for line in reply.splitlines():
+            key, sep, value = line.partition("=")
+            if sep:
+                status[key] = value
+        return status
+
+    def status(self) -> Dict[str, str]:
+        return self._parse_status(self.request("STATUS"))
+
+    async def astatus(self) -> Dict[str, str]:
+        return self._parse_status(await self.arequest("STATUS"))
+
+
+class WpaMonitor(WpaCtrl):
+    """Control connection receiving unsolicited events."""
+
+    def open(self) -> None:
+        super().open()
+        try:
+            self._attached(self.request("ATTACH"))
+        except OSError:
+            self.close()
+            raise
+
+    async def aopen(self) -> None:
+        """Like open(), without blocking the running event loop."""
+        super().open()
+        try:
+            self._attached(await self.arequest("ATTACH"))
+        except OSError:
+            self.close()
+            raise
+
+    @staticmethod
+    def _attached(reply: str) -> None:
+        if not reply.startswith("OK"):
+            raise OSError("ATTACH failed: %s" % reply.strip())
+
+    def close(self) -> None:
+        if self._sock:
+            try:
+                self._sock.send(b"DETACH")
+            except OSError:
+                pass
+        super().close()
+
+    def event(self) -> str:
+        """Receive a single pending event without its level prefix."""
+        msg = self._sock.recv(4096).decode("utf8", "replace")
+        if msg.startswith("<"):
+            msg = msg.split(">", 1)[-1]
+        return msg.strip()
@@ -1,18 +1,135 @@
-import os
+import asyncio
 import logging
-from subprocess import Popen, PIPE
+import math
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from typing import Dict, Tuple
 import xml.etree.ElementTree as ET
 from .bases import StorAvailPlugin, StorAvailInstance
 from pystatus.helpers import peek_binary
+from pystatus.process import communicate, run
+
+
+_checked = set()
+_checked_lock = threading.Lock()
 
 
 def _check_path(path: str, log: logging.Logger):
-    p = Popen([path, "version"], stdin=PIPE, stdout=PIPE, stderr=PIPE)
-    (stdout, stderr) = p.communicate()
-    if p.returncode != 0:
-        log.critical("'%s version' returned non-zero exit code %d",
-                     path, p.returncode)
-        exit(p.returncode)
+    with _checked_lock:
+        if path in _checked:
+            return
+        (returncode, stdout, stderr) = run(path, "version")
+        if returncode != 0:
+            log.critical("'%s version' returned non-zero exit code %d",
+                         path, returncode)
+            exit(returncode)
+        _checked.add(path)
+
+
+class ZFSSampler:
+    """Samples all registered datasets with a single zfs list call.
+
+    One sampler exists per zfs binary. Every instance asks the sampler for
+    its dataset, the first one asking after the samples got older than
+    its maximum age refreshes them for all datasets at once, the others
+    wait for its result.
+    """
+
+    PROPERTIES = ("name", "avail", "used")
+
+    _samplers: Dict[str, "ZFSSampler"] = {}
+    _samplers_lock = threading.Lock()
+
+    def __init__(self, path: str):
+        self._path = path
+        self._log = logging.getLogger("ZFSSampler")
+        self._datasets = Counter()
+        self._samples: Dict[str, Tuple[int, int]] = {}
+        self._sampled = frozenset()
+        self._stamp = 0.0
+        # instances may wait on event loops of their own, so the refresh
+        # in progress is a concurrent future
+        self._pending: Future = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls, path: str) -> "ZFSSampler":
+        with cls._samplers_lock:
+            if path not in cls._samplers:
+                cls._samplers[path] = cls(path)
+            return cls._samplers[path]
+
+    @property
+    def log(self) -> logging.Logger:
+        return self._log
+
+    def register(self, dataset: str) -> None:
+        with self._lock:
+            self._datasets[dataset] += 1
+
+    def unregister(self, dataset: str) -> None:
+        with self._lock:
+            if dataset not in self._datasets:
+                return
+            self._datasets[dataset] -= 1
+            if self._datasets[dataset] <= 0:
+                del self._datasets[dataset]
+                self._samples.pop(dataset, None)
+
+    async def _sample(self) -> None:
+        with self._lock:
+            datasets = list(self._datasets)
+        # as old as the moment zfs was asked, however long it takes
+        stamp = time.monotonic()
+        (returncode, stdout, stderr) = await communicate(
+            self._path, "list", "-H", "-p",
+            "-o", ",".join(self.PROPERTIES), *datasets)
+        if returncode != 0:
+            # missing datasets fail the call, but the others are listed
+            self.log.error("zfs list returned %d: %s", returncode,
+                           stderr.decode("utf8").strip())
+        samples = {}
+        for line in stdout.decode("utf8").splitlines():
+            fields = line.split("\t")
+            if len(fields) != len(self.PROPERTIES):
+                continue
+            try:
+                samples[fields[0]] = (int(fields[1]), int(fields[2]))
+            except ValueError:
+                self.log.warn("Failed to parse line '%s'", line)
+        with self._lock:
+            self._samples = samples
+            self._sampled = frozenset(datasets)
+            self._stamp = stamp
+
+    async def sample(self, dataset: str,
+                     max_age: float) -> Tuple[int, int]:
+        """Returns (available, used) of a dataset or None."""
+        while True:
+            with self._lock:
+                if (dataset in self._sampled
+                        and time.monotonic() - self._stamp <= max_age):
+                    return self._samples.get(dataset)
+                pending = self._pending
+                if pending is None:
+                    self._pending = Future()
+            if pending is not None:
+                # someone else is sampling right now, wait for the result
+                # without cancelling it for the others if we are cancelled
+                await asyncio.shield(asyncio.wrap_future(pending))
+                # finished after we asked, that's fresh enough
+                max_age = math.inf
+                continue
+            try:
+                await self._sample()
+            finally:
+                with self._lock:
+                    (pending, self._pending) = (self._pending, None)
+                pending.set_result(None)
+            with self._lock:
+                return self._samples.get(dataset)
 
 
 class ZFS(StorAvailPlugin):
@@ -28,6 +145,8 @@ class ZFS(StorAvailPlugin):
 
 
 class ZFSInstance(StorAvailInstance):
+    blocking = True
+
     def __init__(self, *args, **kwargs):
         options = {
             "text": None,
@@ -50,6 +169,13 @@ class ZFSInstance(StorAvailInstance):
             if not self._zfs:
                 self.log.critical("zfs not found!")
                 exit(6)
+        self._sampler = ZFSSampler.get(self._zfs)
+        self._sampler.register(self._dataset)
+        self._stale = False
+        if not self.adaptive:
+            # instances with the same interval tick together, so a single
+            # zfs list call per interval samples all of them
+            self.align = self.interval
 
     def _peek_path(self) -> str:
         p = peek_binary("zfs")
@@ -59,14 +185,24 @@ class ZFSInstance(StorAvailInstance):
         _check_path(p, self.log)
         return p
 
-    def get_available(self):
-        p = Popen([self._zfs,
-                   "list", "-H", "-p", "-o", "avail",
-                   self._dataset],
-                  stdin=PIPE, stdout=PIPE, stderr=PIPE)
-        (stdout, stderr) = p.communicate()
-        if p.returncode != 0:
+    def refresh(self) -> None:
+        self._stale = True
+        super().refresh()
+
+    async def get_available(self):
+        # samples taken by other instances during this tick are good enough
+        max_age = 0 if self._stale else self.interval / 2
+        self._stale = False
+        sample = await self._sampler.sample(self._dataset, max_age)
+        if not sample:
             self.log.error("Failed to get available size in dataset %s",
                            self._dataset)
             return 0
-        return int(stdout)
+        return sample[0]
+
+    async def update(self):
+        self.render(await self.get_available())
+
+    def close(self) -> None:
+        self._sampler.unregister(self._dataset)
+        super().close()
@@ -0,0 +1,190 @@
+import ast
+import json
+import logging
+import os
+import tempfile
+from typing import Dict, Optional
+
+
+# bump whenever the layout of an entry changes
+MANIFEST_VERSION = 1
+
+
+def _const(node: ast.AST) -> Optional[str]:
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    return None
+
+
+def _is_super_init(call: ast.Call) -> bool:
+    func = call.func
+    return (isinstance(func, ast.Attribute) and func.attr == "__init__"
+            and isinstance(func.value, ast.Call)
+            and isinstance(func.value.func, ast.Name)
+            and func.value.func.id == "super")
+
+
+def _is_register_option(call: ast.Call) -> bool:
+    func = call.func
+    return (isinstance(func, ast.Attribute)
+            and func.attr == "register_option"
+            and isinstance(func.value, ast.Name) and func.value.id == "self")
+
+
+def _plugin_class(cls: ast.ClassDef) -> Optional[dict]:
+    """Name, version and options of a plugin class, None if it isn't one."""
+    info = None
+    options = {}
+    for node in ast.walk(cls):
+        if not isinstance(node, ast.Call):
+            continue
+        if _is_super_init(node) and len(node.args) >= 2:
+            name, version = _const(node.args[0]), _const(node.args[1])
+            if name:
+                info = {"name": name, "version": version}
+        elif _is_register_option(node) and node.args:
+            option = _const(node.args[0])
+            if option and len(node.args) > 1:
+                kind = node.args[1]
+                options[option] = (kind.id if isinstance(kind, ast.Name)
+                                   else None)
+    if info:
+        info["options"] = options
+    return info
+
+
+def _plugin_ref(tree: ast.Module) -> Optional[str]:
+    """Name of the class the module level plugin factory refers to."""
+    for node in tree.body:
+        if isinstance(node, ast.Assign):
+            if (any(isinstance(t, ast.Name) and t.id == "plugin"
+                    for t in node.targets)
+                    and isinstance(node.value, ast.Name)):
+                return node.value.id
+        elif isinstance(node, ast.FunctionDef) and node.name == "plugin":
+            for ret in ast.walk(node):
+                if (isinstance(ret, ast.Return)
+                        and isinstance(ret.value, ast.Call)
+                        and isinstance(ret.value.func, ast.Name)):
+                    return ret.value.func.id
+    return None
+
+
+def read_manifest(path: str) -> Optional[dict]:
+    """Describe the plugin of an external module without executing it.
+
+    Returns None if the plugin can't be told from the source alone, e.g.
+    because its name is computed, the module has to be imported then.
+    """
+    with open(path, "rb") as f:
+        tree = ast.parse(f.read(), path)
+    classes = {}
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef):
+            info = _plugin_class(node)
+            if info:
+                classes[node.name] = info
+    ref = _plugin_ref(tree)
+    if ref in classes:
+        return classes[ref]
+    if len(classes) == 1:
+        return next(iter(classes.values()))
+    return None
+
+
+class ManifestCache:
+    """Manifests of external plugin modules, keyed by path, size and mtime.
+
+    Only new or changed modules are parsed again, the cache is written back
+    by save() if anything changed.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._entries: Dict[str, dict] = {}
+        self._dirty = False
+        self._loaded = False
+        self._log = logging.getLogger("ManifestCache")
+
+    @property
+    def log(self) -> logging.Logger:
+        return self._log
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def _load(self) -> None:
+        self._loaded = True
+        try:
+            with open(self._path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") == MANIFEST_VERSION:
+            self._entries = data.get("files", {})
+
+    def scan(self, dirpath: str) -> Dict[str, Optional[dict]]:
+        """Manifests of all plugin modules in dirpath by their path."""
+        if not self._loaded:
+            self._load()
+        dirpath = os.path.normpath(dirpath)
+        manifests = {}
+        for entry in sorted(os.scandir(dirpath), key=lambda e: e.name):
+            if (entry.name.startswith("__")
+                    or not entry.name.lower().endswith(".py")
+                    or not entry.is_file()):
+                continue
+            st = entry.stat()
+            cached = self._entries.get(entry.path)
+            if (cached and cached["size"] == st.st_size
+                    and cached["mtime"] == st.st_mtime_ns):
+                manifests[entry.path] = cached["plugin"]
+                continue
+            self.log.debug("Reading manifest of %s", entry.path)
+            try:
+                plugin = read_manifest(entry.path)
+            except (OSError, SyntaxError, ValueError) as e:
+                self.log.warning("Failed to parse plugin %s: %s",
+                                 entry.path, e)
+                plugin = None
+            self._entries[entry.path] = {"size": st.st_size,
+                                         "mtime": st.st_mtime_ns,
+                                         "plugin": plugin}
+            self._dirty = True
+            manifests[entry.path] = plugin
+        for path in list(self._entries):
+            if os.path.dirname(path) == dirpath and path not in manifests:
+                # removed from the directory
+                del self._entries[path]
+                self._dirty = True
+        return manifests
+
+    def stamp(self, path: str) -> Optional[tuple]:
+        """Size and mtime of a module as of the last scan, None if gone."""
+        entry = self._entries.get(path)
+        if not entry:
+            return None
+        return (entry["size"], entry["mtime"])
+
+    def save(self) -> None:
+        """Write the cache atomically, if anything changed."""
+        if not self._dirty:
+            return
+        data = {"version": MANIFEST_VERSION, "files": self._entries}
+        directory = os.path.dirname(self._path) or "."
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(data, f)
+                os.replace(tmp, self._path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        except OSError as e:
+            self.log.warning("Failed to write plugin cache %s: %s",
+                             self._path, e)
+            return
+        self._dirty = False
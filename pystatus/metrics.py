@@ -0,0 +1,288 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from typing import Callable, Iterable, List, Tuple
+
+
+# upper bounds of the buckets in seconds, like Prometheus' "le"
+UPDATE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                  0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+FRAME_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+                 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1)
+
+
+class Histogram:
+    """Counts of observed values in fixed buckets.
+
+    Observing only increments counters, so it is cheap enough to be done
+    for every update. Values are written by a single thread at a time and
+    may be read racily by the exporter.
+    """
+
+    __slots__ = ("_bounds", "_counts", "_sum", "_count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self._bounds = bounds
+        # the last bucket catches everything above the largest bound
+        self._counts = [0] * (len(bounds) + 1)
+        self._sum = 0.0
+        self._count = 0
+
+    @property
+    def bounds(self) -> Tuple[float, ...]:
+        return self._bounds
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def observe(self, value: float) -> None:
+        self._counts[bisect.bisect_left(self._bounds, value)] += 1
+        self._sum += value
+        self._count += 1
+
+    def cumulative(self) -> List[int]:
+        """Count of values up to each bound, then of all values."""
+        counts, total = [], 0
+        for count in self._counts:
+            total += count
+            counts.append(total)
+        return counts
+
+
+class UpdateStats:
+    """Runtime statistics of the updates of a single instance."""
+
+    __slots__ = ("_durations", "_overruns", "_errors", "_timeouts",
+                 "_last_success")
+
+    def __init__(self):
+        self._durations = Histogram(UPDATE_BUCKETS)
+        self._overruns = 0
+        self._errors = 0
+        self._timeouts = 0
+        self._last_success: float = None
+
+    @property
+    def durations(self) -> Histogram:
+        return self._durations
+
+    @property
+    def overruns(self) -> int:
+        """Updates which took longer than the interval."""
+        return self._overruns
+
+    @property
+    def errors(self) -> int:
+        return self._errors
+
+    @property
+    def timeouts(self) -> int:
+        """Updates which ran past their deadline."""
+        return self._timeouts
+
+    @property
+    def last_success(self) -> float:
+        """Monotonic time the last successful update finished at."""
+        return self._last_success
+
+    def record(self, start: float, end: float, interval: float) -> None:
+        duration = end - start
+        self._durations.observe(duration)
+        if interval and duration > interval:
+            self._overruns += 1
+        self._last_success = end
+
+    def failed(self) -> None:
+        self._errors += 1
+
+    def timed_out(self) -> None:
+        self._timeouts += 1
+
+
+class FrameStats:
+    """Time spent per frame on serializing and on writing it."""
+
+    __slots__ = ("_serialize", "_write")
+
+    def __init__(self):
+        self._serialize = Histogram(FRAME_BUCKETS)
+        self._write = Histogram(FRAME_BUCKETS)
+
+    @property
+    def serialize(self) -> Histogram:
+        return self._serialize
+
+    @property
+    def write(self) -> Histogram:
+        return self._write
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    escaped = ("%s=\"%s\"" % (k, str(v).replace("\\", "\\\\")
+                              .replace("\"", "\\\"").replace("\n", "\\n"))
+               for k, v in labels.items())
+    return "{" + ",".join(escaped) + "}"
+
+
+class Exposition:
+    """Builds metrics in the Prometheus text format."""
+
+    def __init__(self):
+        self._lines: List[str] = []
+        self._described = set()
+
+    def _describe(self, name: str, kind: str, text: str) -> None:
+        if name in self._described:
+            return
+        self._described.add(name)
+        self._lines.append("# HELP %s %s" % (name, text))
+        self._lines.append("# TYPE %s %s" % (name, kind))
+
+    def sample(self, name: str, kind: str, text: str, value: float,
+               labels: dict = None) -> None:
+        self._describe(name, kind, text)
+        self._lines.append("%s%s %s" % (name, _labels(labels), repr(value)))
+
+    def histogram(self, name: str, text: str, hist: Histogram,
+                  labels: dict = None) -> None:
+        self._describe(name, "histogram", text)
+        labels = labels or {}
+        bounds = [repr(b) for b in hist.bounds] + ["+Inf"]
+        for bound, count in zip(bounds, hist.cumulative()):
+            self._lines.append("%s_bucket%s %d" % (
+                name, _labels(dict(labels, le=bound)), count))
+        self._lines.append("%s_sum%s %s" % (name, _labels(labels),
+                                             repr(hist.sum)))
+        self._lines.append("%s_count%s %d" % (name, _labels(labels),
+                                               hist.count))
+
+    def text(self) -> str:
+        return "\n".join(self._lines) + "\n"
+
+
+def process_usage() -> Tuple[float, int]:
+    """CPU seconds and resident memory in bytes of this process."""
+    times = os.times()
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        # only the maximum is known, in kilobytes
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return times.user + times.system, rss
+
+
+def exposition(instances: Iterable, frames: FrameStats,
+               dropped: int = None) -> str:
+    """Metrics of all instances and frames in Prometheus text format."""
+    out = Exposition()
+    # last success is kept on the monotonic clock, exported as unix time
+    offset = time.time() - time.monotonic()
+    # samples of a metric have to be grouped, so one pass per metric
+    instances = list(instances)
+    stats = [({"plugin": inst.block.name, "instance": inst.block.instance},
+              inst.stats) for inst in instances]
+    for labels, s in stats:
+        out.histogram("pystatus_update_duration_seconds",
+                      "Duration of block updates.", s.durations, labels)
+    for labels, s in stats:
+        out.sample("pystatus_update_overruns_total", "counter",
+                   "Updates which took longer than the interval.",
+                   s.overruns, labels)
+    for labels, s in stats:
+        out.sample("pystatus_update_errors_total", "counter",
+                   "Updates which failed with an exception.",
+                   s.errors, labels)
+    for labels, s in stats:
+        out.sample("pystatus_update_timeouts_total", "counter",
+                   "Updates which ran past their deadline.",
+                   s.timeouts, labels)
+    for labels, s in stats:
+        if s.last_success is not None:
+            out.sample("pystatus_update_last_success_timestamp_seconds",
+                       "gauge", "Time the last successful update finished.",
+                       s.last_success + offset, labels)
+    for (labels, _), inst in zip(stats, instances):
+        out.sample("pystatus_block_stale", "gauge",
+                   "Whether the block shows outdated values.",
+                   int(inst.stale), labels)
+    out.histogram("pystatus_frame_serialize_seconds",
+                  "Time spent serializing frames.", frames.serialize)
+    out.histogram("pystatus_frame_write_seconds",
+                  "Time spent writing frames.", frames.write)
+    if dropped is not None:
+        out.sample("pystatus_frames_dropped_total", "counter",
+                   "Outdated frames replaced before they were written.",
+                   dropped)
+    cpu, rss = process_usage()
+    out.sample("process_cpu_seconds_total", "counter",
+               "Total user and system CPU time spent in seconds.", cpu)
+    out.sample("process_resident_memory_bytes", "gauge",
+               "Resident memory size in bytes.", rss)
+    return out.text()
+
+
+def write_atomic(path: str, text: str) -> None:
+    """Replace path with text, readers never see a partial file."""
+    # only needed with a metrics file, it adds to startup
+    import tempfile
+    directory = os.path.dirname(path) or "."
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".pystatus-",
+                               suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class MetricsWriter(threading.Thread):
+    """Rewrites the metrics file every interval seconds until stopped."""
+
+    def __init__(self, path: str, interval: float,
+                 collect: Callable[[], str]):
+        super().__init__(name="pystatus_metrics", daemon=True)
+        self._path = path
+        self._interval = interval
+        self._collect = collect
+        self._stopped = threading.Event()
+        self._log = logging.getLogger("MetricsWriter")
+
+    @property
+    def log(self) -> logging.Logger:
+        return self._log
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def write(self) -> None:
+        try:
+            write_atomic(self._path, self._collect())
+        except OSError as e:
+            self.log.error("Failed to write metrics to %s: %s",
+                           self._path, e)
+
+    def run(self) -> None:
+        while not self._stopped.wait(self._interval):
+            self.write()
+
+    def stop(self) -> None:
+        """Stop and write the final metrics."""
+        self._stopped.set()
+        if self.is_alive():
+            self.join()
+        self.write()
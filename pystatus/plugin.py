@@ -1,13 +1,29 @@
 import abc
+from collections.abc import Awaitable
 import threading
 import time
 import importlib.util
 import logging
-import re
 import os
-from typing import Union, Type, Callable
+from typing import Any, Union, Type, Callable, List
 import pystatus.config
 import pystatus.i3bar
+import pystatus.internal
+from pystatus.helpers import cache_path
+from pystatus.metrics import UpdateStats
+from pystatus.process import Children, current as current_children
+from pystatus.profiling import Profiler
+from pystatus.template import Template
+from pystatus.engine import IEngine, ThreadEngine
+from pystatus.watchdog import watchdog
+
+
+# seconds an update may take before its block is marked stale
+TIMEOUT = 10.0
+STALE_COLOR = "#808080"
+# seconds until the first retry of a failed update, doubled per failure
+BACKOFF = 1.0
+MAX_BACKOFF = 300.0
 
 
 class Author:
@@ -29,7 +45,119 @@ class Author:
         return self.name
 
 
+class IProvider(abc.ABC):
+    """Source of samples shared between all instances.
+
+    The source is sampled at most once per maximum age requested by its
+    subscribers, no matter how many of them ask.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._lock = threading.Lock()
+        self._sample = None
+        self._stamp = 0.0
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @abc.abstractmethod
+    def sample(self) -> Any:
+        raise NotImplementedError
+
+    def delta(self, prev: Any, cur: Any) -> Any:
+        """Derive a value from two consecutive samples of one subscriber."""
+        return cur
+
+    def get(self, max_age: float) -> Any:
+        with self._lock:
+            now = time.monotonic()
+            if self._sample is None or now - self._stamp > max_age:
+                self._sample = self.sample()
+                self._stamp = now
+            return self._sample
+
+
+class Subscription:
+    """A subscriber's view of a provider, holding its own delta state."""
+
+    def __init__(self, provider: IProvider, max_age: float):
+        self._provider = provider
+        self._max_age = max_age
+        self._stale = False
+        self._prev = None
+        self._last = None
+
+    @property
+    def provider(self) -> IProvider:
+        return self._provider
+
+    def get(self) -> Any:
+        if self._stale:
+            self._stale = False
+            return self._provider.get(0)
+        return self._provider.get(self._max_age)
+
+    def invalidate(self) -> None:
+        """Take a new sample on the next get()."""
+        self._stale = True
+
+    def delta(self) -> Any:
+        """Value derived from the current and this subscriber's previous
+        sample, None on first call."""
+        cur = self.get()
+        if cur is self._prev:
+            # no new sample since our last call
+            return self._last
+        if self._prev is not None:
+            self._last = self._provider.delta(self._prev, cur)
+        self._prev = cur
+        return self._last
+
+
+class ProviderRegistry:
+    """Maps source names like 'statvfs:/home' to shared providers.
+
+    Factories are registered per prefix and called with the part after the
+    colon, if any.
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._providers = {}
+        self._lock = threading.Lock()
+        self._log = logging.getLogger("ProviderRegistry")
+
+    def register(self, prefix: str,
+                 factory: Callable[[str], IProvider]) -> None:
+        with self._lock:
+            if prefix in self._factories:
+                self._log.warn("Overwriting provider %s", prefix)
+            self._factories[prefix] = factory
+
+    def provider(self, name: str) -> IProvider:
+        with self._lock:
+            if name not in self._providers:
+                prefix, _, arg = name.partition(":")
+                if prefix not in self._factories:
+                    raise KeyError("Unknown provider %s" % name)
+                self._log.debug("Creating provider %s", name)
+                self._providers[name] = self._factories[prefix](arg)
+            return self._providers[name]
+
+    def subscribe(self, name: str, max_age: float) -> Subscription:
+        return Subscription(self.provider(name), max_age)
+
+
+providers = ProviderRegistry()
+
+
 class IInstance(threading.Thread, metaclass=abc.ABCMeta):
+    # Instances whose update() may block for a long time should set this,
+    # so the scheduler engine keeps running them in their own thread.
+    blocking = False
+
     def __init__(self, *args, **kwargs):
         self._block: pystatus.i3bar.Block = kwargs.get("block")
         if not self._block:
@@ -37,11 +165,38 @@ class IInstance(threading.Thread, metaclass=abc.ABCMeta):
         del kwargs["block"]
 
         self._stopped = False
+        # event loop for coroutine updates outside of the asyncio engine
+        self._loop = None
+        self._wakeup = threading.Event()
+        self._waker: Callable[[], None] = self._wakeup.set
+        self._resumed = threading.Event()
+        self._resumed.set()
+        self._align: float = None
+        self._hysteresis: float = kwargs.pop("hysteresis", 0.0)
         if "interval" in kwargs:
             self._interval = kwargs["interval"]
             del kwargs["interval"]
         else:
             self._interval = 5
+        self._adaptive: bool = kwargs.pop("adaptive", False)
+        self._max_interval: float = kwargs.pop("max_interval", 60)
+        self._effective: float = None
+        self._version: int = None
+        # refresh on SIGRTMIN + signal
+        self._signal: int = kwargs.pop("signal", None)
+        self._subscriptions = []
+        self._stats = UpdateStats()
+        self._profiler: Profiler = None
+        # deadline of every update, none if 0
+        self._timeout: float = kwargs.pop("timeout", TIMEOUT)
+        self._stale_text: str = kwargs.pop("stale_text", None)
+        self._stale_color: str = kwargs.pop("stale_color", STALE_COLOR)
+        self._stale_urgent: bool = kwargs.pop("stale_urgent", False)
+        self._failures = 0
+        # set by the watchdog, if the running update missed its deadline
+        self._timed_out = False
+        self._children = Children()
+        self._on_timeout: Callable[[], None] = None
 
         plugin: str = kwargs.get("plugin")
         if not plugin:
@@ -52,6 +207,15 @@ class IInstance(threading.Thread, metaclass=abc.ABCMeta):
             raise ValueError("name for instance must be defined")
         kwargs["name"] = "%s_%s" % (plugin, self._name)
         self._log = logging.getLogger(kwargs["name"])
+        if self._stale_text:
+            try:
+                self._stale_text.format(text="")
+            except (KeyError, IndexError, ValueError) as e:
+                self.log.error("Invalid stale_text %r, only {text} may be "
+                               "used: %s", self._stale_text, e)
+                self._stale_text = None
+        # a hung update must never keep pystatus from exiting
+        kwargs.setdefault("daemon", True)
 
         # parse plugin options
         options: dict = kwargs.get("options")
@@ -86,23 +250,321 @@ class IInstance(threading.Thread, metaclass=abc.ABCMeta):
     def interval(self) -> int:
         return self._interval
 
+    @property
+    def adaptive(self) -> bool:
+        return self._adaptive
+
+    @property
+    def signal(self) -> int:
+        return self._signal
+
+    @property
+    def stats(self) -> UpdateStats:
+        return self._stats
+
+    @property
+    def profiler(self) -> Profiler:
+        return self._profiler
+
+    @profiler.setter
+    def profiler(self, value: Profiler) -> None:
+        self._profiler = value
+
+    @property
+    def label(self) -> str:
+        """Name of the block in reports, like "plugin:instance"."""
+        return "%s:%s" % (self._block.name, self._block.instance)
+
+    @property
+    def effective_interval(self) -> float:
+        """The interval currently used, may be larger if adaptive."""
+        return self._effective or self._interval
+
+    @property
+    def align(self) -> float:
+        """Period in seconds ticks are aligned to on the wall clock."""
+        return self._align
+
+    @align.setter
+    def align(self, value: float) -> None:
+        self._align = value
+
+    @property
+    def waker(self) -> Callable[[], None]:
+        return self._waker
+
+    @waker.setter
+    def waker(self, value: Callable[[], None]) -> None:
+        # None wakes up our own thread again
+        self._waker = value or self._wakeup.set
+
+    @property
+    def timeout(self) -> float:
+        return self._timeout
+
+    @property
+    def on_timeout(self) -> Callable[[], None]:
+        """Called by the watchdog when an update runs past its deadline."""
+        return self._on_timeout
+
+    @on_timeout.setter
+    def on_timeout(self, value: Callable[[], None]) -> None:
+        self._on_timeout = value
+
+    @property
+    def stale(self) -> bool:
+        """Whether the block is marked as outdated."""
+        return self._block.overridden
+
+    @property
+    def updated(self) -> bool:
+        """Whether any update finished yet, successful or not."""
+        stats = self._stats
+        return bool(stats.durations.count or stats.errors or stats.timeouts)
+
+    @property
+    def failures(self) -> int:
+        """Number of updates failed in a row."""
+        return self._failures
+
+    @property
+    def backoff(self) -> float:
+        """Seconds until a failed update is retried."""
+        delay = BACKOFF * 2 ** min(self._failures - 1, 16)
+        return max(self._interval, min(delay, MAX_BACKOFF))
+
+    def template(self, fmt: str) -> Template:
+        """Compile a configured template, None stays None."""
+        if not fmt:
+            return None
+        return Template(fmt, self._hysteresis)
+
+    def subscribe(self, name: str) -> Subscription:
+        """Subscribe to a shared source, sampled at most once per tick."""
+        subscription = providers.subscribe(name, self.interval / 2)
+        self._subscriptions.append(subscription)
+        return subscription
+
+    def next_deadline(self, due: float, now: float) -> float:
+        """Monotonic time of the tick following the one due at due.
+
+        Aligned instances tick on the next wall clock boundary, all others
+        keep their cadence unless they fell behind. Failed updates are
+        retried with exponential backoff.
+        """
+        if self._failures:
+            return now + self.backoff
+        if self._align:
+            wall = time.time()
+            local = wall + time.localtime(wall).tm_gmtoff
+            return now + self._align - local % self._align
+        if self._adaptive:
+            self._adapt()
+        interval = self.effective_interval
+        due += interval
+        if due < now:
+            due = now + interval
+        return due
+
+    def near_threshold(self) -> bool:
+        """Whether the shown value is close to changing its color.
+
+        Adaptive instances keep polling at their interval while this is
+        true, plugins with thresholds should override it.
+        """
+        return False
+
+    def _adapt(self) -> None:
+        # back off exponentially while the block stays the same
+        version = self._block.version
+        current = self.effective_interval
+        if version != self._version or self.near_threshold():
+            effective = self._interval
+        else:
+            effective = min(current * 2, max(self._max_interval,
+                                             self._interval))
+        self._version = version
+        if effective != current:
+            self.log.debug("Effective interval now %.1fs", effective)
+        self._effective = effective
+
+    def wake(self) -> None:
+        """Request an immediate update, safe to call from any thread."""
+        self._waker()
+
+    def refresh(self) -> None:
+        """Update right away from fresh samples, e.g. after a click."""
+        for subscription in self._subscriptions:
+            subscription.invalidate()
+        self.wake()
+
+    def on_click(self, event: dict) -> None:
+        """Handle a click event of i3bar, followed by an update.
+
+        Called from the event thread, so it should return quickly.
+        """
+
     @abc.abstractmethod
     def update(self) -> None:
+        """Update the block. May also be implemented as coroutine."""
         raise NotImplementedError
 
+    def tick(self) -> None:
+        """Run a single update outside of an event loop."""
+        start, token = self._begin()
+        ok = False
+        try:
+            if self._profiler:
+                self._profiler.scope(self.label, type(self)).call(self._tick)
+            else:
+                self._tick()
+            ok = True
+        except Exception as e:
+            self._failed(e)
+        finally:
+            self._end(start, token, ok)
+
+    async def atick(self) -> None:
+        """Run a single coroutine update on the running event loop."""
+        start, token = self._begin()
+        ok = False
+        try:
+            if self._profiler:
+                scope = self._profiler.scope(self.label, type(self))
+                await scope.wrap(self.update())
+            else:
+                await self.update()
+            ok = True
+        except Exception as e:
+            self._failed(e)
+        finally:
+            self._end(start, token, ok)
+
+    def _tick(self) -> None:
+        result = self.update()
+        if isinstance(result, Awaitable):
+            if not self._loop:
+                import asyncio
+                self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(result)
+
+    def _begin(self) -> tuple:
+        start = time.monotonic()
+        if self._timeout:
+            watchdog().watch(self, start + self._timeout)
+        # child processes started by the update are ours
+        return start, current_children.set(self._children)
+
+    def _end(self, start: float, token, ok: bool) -> None:
+        end = time.monotonic()
+        current_children.reset(token)
+        if self._timeout:
+            # the watchdog is done with us once this returns
+            watchdog().done(self)
+        timed_out, self._timed_out = self._timed_out, False
+        if not ok:
+            return
+        if timed_out:
+            # its child processes may have been killed, don't trust it
+            self._failures += 1
+            self.log.warning("Update returned after %.1fs, retrying in "
+                             "%.0fs", end - start, self.backoff)
+            self.mark_stale()
+            return
+        self._stats.record(start, end, self._interval)
+        if self._failures or self._block.overridden:
+            if self._failures:
+                self.log.info("Update succeeded again")
+            self._failures = 0
+            self._block.override(None)
+
+    def _failed(self, e: Exception) -> None:
+        self._stats.failed()
+        self._failures += 1
+        # the traceback only once, not on every retry
+        self.log.error("Update failed, retrying in %.0fs: %s",
+                       self.backoff, e, exc_info=self._failures == 1)
+        self.mark_stale()
+
+    def timed_out(self) -> None:
+        """Handle an update running past its deadline.
+
+        Called by the watchdog, while the update may still be running.
+        """
+        self._stats.timed_out()
+        self._timed_out = True
+        killed = self._children.kill()
+        self.log.warning("Update takes longer than %.1fs, killed %d child "
+                         "processes", self._timeout, killed)
+        if self._on_timeout:
+            self._on_timeout()
+
+    def mark_stale(self, blocking: bool = True) -> bool:
+        """Show the block as outdated until the next successful update.
+
+        Returns False if blocking is not set and the block is locked.
+        """
+        fields = {}
+        if self._stale_text:
+            fields["full_text"] = self._stale_text.format(
+                text=self._block.full_text or "")
+            fields["short_text"] = None
+        if self._stale_color:
+            fields["color"] = self._stale_color
+        if self._stale_urgent:
+            fields["urgent"] = True
+        return self._block.override(fields or {"urgent": False}, blocking)
+
+    def close(self) -> None:
+        # a stuck update may still run the loop, it closes it once done
+        if self._loop and not self._loop.is_running():
+            self._loop.close()
+            self._loop = None
+
     def start(self) -> None:
         self._stopped = False
         super().start()
 
+    @property
+    def paused(self) -> bool:
+        return not self._resumed.is_set()
+
+    def pause(self) -> None:
+        """Stop ticking in our own thread until resume() is called."""
+        self._resumed.clear()
+        self._wakeup.set()
+
+    def resume(self) -> None:
+        """Continue ticking, starting with an immediate update."""
+        self._resumed.set()
+
     def stop(self, join: bool = True) -> None:
         self._stopped = True
-        if join:
+        self._resumed.set()
+        self._wakeup.set()
+        # instances driven by the scheduler engine never start their thread
+        if join and self.ident is not None:
             self.join()
 
     def run(self) -> None:
-        while not self.stopped:
-            self.update()
-            time.sleep(self.interval)
+        try:
+            if self._failures:
+                # taken over from another engine, keep backing off
+                self._wakeup.wait(self.backoff)
+                self._wakeup.clear()
+            due = time.monotonic()
+            while not self.stopped:
+                if not self._resumed.is_set():
+                    self._resumed.wait()
+                    continue
+                self.tick()
+                now = time.monotonic()
+                due = self.next_deadline(due, now)
+                if self._wakeup.wait(due - now):
+                    due = time.monotonic()
+                self._wakeup.clear()
+        finally:
+            self.close()
 
 
 class IPlugin(abc.ABC):
@@ -141,78 +603,203 @@ class IPlugin(abc.ABC):
                           **options)
 
 
+# entry point group of plugins installed as packages
+ENTRY_POINTS = "pystatus.plugins"
+
+
 class PluginParent:
     def __init__(self):
         self._plugins = {}
         self._instances = {}
+        # plugin name -> module path, from the plugin directory
+        self._externals = {}
+        self._imported = set()
+        # plugin name -> module path, and module path -> stamp when imported
+        self._sources = {}
+        self._stamps = {}
+        self._manifests = None
+        self._profiler: Profiler = None
+        self._engine = ThreadEngine()
         self._log = logging.getLogger("PluginParent")
 
-    def _load_internals(self) -> None:
-        from pystatus.internal import PLUGINS
-        self._log.debug("Loading internal plugins...")
-        for plugin in PLUGINS:
-            p = plugin()
-            self._plugins[p.name.lower()] = p
+    @property
+    def engine(self) -> IEngine:
+        return self._engine
+
+    @engine.setter
+    def engine(self, value: IEngine) -> None:
+        self._engine = value
+
+    @property
+    def profiler(self) -> Profiler:
+        """Profiler given to all instances created from now on."""
+        return self._profiler
+
+    @profiler.setter
+    def profiler(self, value: Profiler) -> None:
+        self._profiler = value
+
+    def _plugin(self, name: str) -> IPlugin:
+        # plugins are only imported once a block uses them
+        if name not in self._plugins:
+            p = self._load_plugin(name)
+            if not p:
+                return None
+            self._plugins[name] = p
             self._log.debug("Loaded %s [%s - %s]",
                             p.name, p.version, p.author)
-        del PLUGINS
-
-    def _load_externals(self, dirpath: str) -> None:
-        search = re.compile(r"\.py$", re.IGNORECASE)
-        files = filter(lambda f: (not f.startswith("__")
-                                  and search.search(f)),
-                       os.listdir(dirpath))
-        for path in files:
-            plugin_name = os.path.splitext(os.path.basename(path))[0]
-            modname = "pystatus.plugin.%s" % plugin_name
-            spec = importlib.util.spec_from_file_location(modname, path)
-            mod = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(mod)
-            plugin = mod.plugin()
+        return self._plugins[name]
+
+    def _load_plugin(self, name: str) -> IPlugin:
+        # the plugin directory may replace internal plugins
+        if name in self._externals:
+            return self._load_external(self._externals[name])
+        cls = pystatus.internal.plugin(name)
+        if cls:
+            return cls()
+        return self._load_entry_point(name)
+
+    def _load_external(self, path: str) -> IPlugin:
+        self._imported.add(path)
+        if self._manifests:
+            self._stamps[path] = self._manifests.stamp(path)
+        plugin_name = os.path.splitext(os.path.basename(path))[0]
+        modname = "pystatus.plugin.%s" % plugin_name
+        spec = importlib.util.spec_from_file_location(modname, path)
+        mod = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(mod)
+        plugin = mod.plugin()
+        self._sources[plugin.name.lower()] = path
+        return plugin
+
+    def _forget(self, path: str) -> None:
+        # the module changed, import it again when it is used next
+        self._log.info("Plugin module %s changed, reloading it", path)
+        for name, source in list(self._sources.items()):
+            if source == path:
+                del self._sources[name]
+                self._plugins.pop(name, None)
+        self._imported.discard(path)
+        del self._stamps[path]
+
+    def stamp(self, plugin: str) -> tuple:
+        """Size and mtime of the module an external plugin was imported
+        from, None for all other plugins."""
+        path = self._sources.get(plugin.lower())
+        return self._stamps.get(path) if path else None
+
+    def _load_entry_point(self, name: str) -> IPlugin:
+        from importlib.metadata import entry_points
+        eps = entry_points()
+        # entry points are selectable since Python 3.10, a dict before
+        group = (eps.select(group=ENTRY_POINTS) if hasattr(eps, "select")
+                 else eps.get(ENTRY_POINTS, ()))
+        for ep in group:
+            if ep.name.lower() == name:
+                self._log.debug("Loading %s from entry point %s",
+                                name, ep.value)
+                return ep.load()()
+        return None
+
+    def _scan_externals(self, dirpath: str) -> None:
+        if not self._manifests:
+            # only imported with a plugin directory, it adds to startup
+            from pystatus.manifest import ManifestCache
+            self._manifests = ManifestCache(cache_path("plugins.json"))
+        externals = {}
+        manifests = self._manifests.scan(dirpath)
+        for path, stamp in list(self._stamps.items()):
+            if self._manifests.stamp(path) != stamp:
+                self._forget(path)
+        for path, manifest in manifests.items():
+            if manifest:
+                externals[manifest["name"].lower()] = path
+                continue
+            if path in self._imported:
+                continue
+            # the name of this one can't be told without importing it
+            plugin = self._load_external(path)
             self._plugins[plugin.name.lower()] = plugin
             self._log.debug("Loaded %s [%s - %s]",
                             plugin.name, plugin.version, plugin.author)
+        self._manifests.save()
+        self._externals = externals
 
-    def load_plugins(self, dirpath: str) -> None:
-        self._load_internals()
+    def load_plugins(self, dirpath: str, names: List[str] = ()) -> None:
+        """Discover the plugins in dirpath and load the given ones.
+
+        Modules in dirpath are only imported if a name refers to them,
+        their manifests are cached until they change.
+        """
         if dirpath and os.path.isdir(dirpath):
-            self._log.info("Loading plugins from %s", dirpath)
-            self._load_externals(dirpath)
+            self._log.debug("Scanning plugins in %s", dirpath)
+            self._scan_externals(dirpath)
+        self.require(names)
+
+    def require(self, names: List[str]) -> None:
+        """Load the plugins with the given names, if not yet.
+
+        Plugins register their options when loaded, so this has to happen
+        before the blocks using them are parsed.
+        """
+        for name in names:
+            self._plugin(name.lower())
 
     def instance(self, plugin: str, name: str,
                  block: pystatus.i3bar.Block,
-                 interval: int, options: dict) -> None:
+                 interval: int, options: dict) -> IInstance:
         plugin = plugin.lower()
-        if plugin not in self._plugins:
+        if not self._plugin(plugin):
             self._log.debug("Plugin %s not found", plugin)
             return None
 
-        color = options.get("color")
-        if isinstance(color, str):
-            block.color = color
-        background = options.get("background")
-        if isinstance(background, str):
-            block.background = background
-
-        block.border = options.get("border")
-        block.min_width = options.get("min_width")
-        block.align = options.get("align")
-        block.separator = options.get("separator")
-        block.separator_block_width = options.get("separator_block_width")
+        with block:
+            color = options.get("color")
+            if isinstance(color, str):
+                block.color = color
+            background = options.get("background")
+            if isinstance(background, str):
+                block.background = background
+
+            block.border = options.get("border")
+            block.min_width = options.get("min_width")
+            block.align = options.get("align")
+            block.separator = options.get("separator")
+            block.separator_block_width = options.get(
+                "separator_block_width")
 
         self._log.debug("Requesting new instance from %s with name %s",
                         plugin, name)
         inst = self._plugins[plugin].instance(name, block, interval, options)
-        inst.start()
+        inst.profiler = self._profiler
+        self.engine.add(inst)
+        self.register(inst)
+        return inst
+
+    def register(self, inst: IInstance) -> None:
+        """Make inst the one found by its name, e.g. for clicks."""
+        self._instances[inst.name.lower()] = inst
+
+    def remove(self, inst: IInstance) -> None:
+        """Stop a single instance, leaving all others running."""
+        self.engine.remove(inst)
+        key = inst.name.lower()
+        # a replacement may already be registered under the same name
+        if self._instances.get(key) is inst:
+            del self._instances[key]
 
-        self._instances["%s_%s" % (plugin, name.lower())] = inst
+    @property
+    def instances(self) -> list:
+        return list(self._instances.values())
+
+    def find(self, plugin: str, name: str) -> IInstance:
+        """The instance of a block, None if there is none."""
+        if not plugin or not name:
+            return None
+        return self._instances.get("%s_%s" % (plugin.lower(), name.lower()))
 
     def stop(self) -> None:
-        for name, instance in self._instances.items():
-            instance.stop(join=False)
-        for name, instance in self._instances.items():
-            self._log.debug("Waiting for instance %s to stop", instance.name)
-            instance.join()
+        self.engine.stop()
 
         for plugin_name, plugin in self._plugins.items():
             self._log.debug("Removing plugin %s", plugin.name)
@@ -220,3 +807,6 @@ class PluginParent:
 
         self._plugins = {}
         self._instances = {}
+        self._imported = set()
+        self._sources = {}
+        self._stamps = {}
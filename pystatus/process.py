@@ -0,0 +1,119 @@
+import contextlib
+import contextvars
+import os
+import signal
+import threading
+from typing import Set, Tuple
+
+
+# the stop and continue signals i3bar is asked to send to our process group
+_GROUP_SIGNALS = {signal.SIGUSR1, signal.SIGUSR2}
+
+
+class Children:
+    """Child processes an instance is waiting for.
+
+    They are killed by the watchdog if the update waiting for them runs
+    past its deadline.
+    """
+
+    def __init__(self):
+        self._pids: Set[int] = set()
+        self._lock = threading.Lock()
+
+    def add(self, pid: int) -> None:
+        with self._lock:
+            self._pids.add(pid)
+
+    def discard(self, pid: int) -> None:
+        with self._lock:
+            self._pids.discard(pid)
+
+    def kill(self) -> int:
+        """Kill all child processes, returns how many there were."""
+        with self._lock:
+            pids = list(self._pids)
+        killed = 0
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGKILL)
+                killed += 1
+            except ProcessLookupError:
+                pass
+        return killed
+
+
+# children of the instance whose update runs in the current context
+current: contextvars.ContextVar = contextvars.ContextVar(
+    "pystatus_children", default=None)
+
+
+@contextlib.contextmanager
+def _spawning():
+    """Block the group signals while a child process is spawned.
+
+    Until the child ignores them, one arriving in between stays pending
+    instead of terminating it.
+    """
+    old = signal.pthread_sigmask(signal.SIG_BLOCK, _GROUP_SIGNALS)
+    try:
+        yield
+    finally:
+        signal.pthread_sigmask(signal.SIG_SETMASK, old)
+
+
+def _ignore_group_signals() -> None:
+    """Run in the child before exec, ignoring drops a pending signal."""
+    for signum in _GROUP_SIGNALS:
+        signal.signal(signum, signal.SIG_IGN)
+    signal.pthread_sigmask(signal.SIG_UNBLOCK, _GROUP_SIGNALS)
+
+
+async def communicate(*args: str) -> Tuple[int, bytes, bytes]:
+    """Run a command and wait for it to exit.
+
+    Returns its exit code and its output on stdout and stderr. The process
+    is killed if the update running it is cancelled or runs past its
+    deadline. It ignores the stop and continue signals i3bar sends to our
+    whole process group, they would terminate it otherwise.
+    """
+    import asyncio
+    from subprocess import PIPE
+    with _spawning():
+        p = await asyncio.create_subprocess_exec(
+            *args, stdin=PIPE, stdout=PIPE, stderr=PIPE,
+            preexec_fn=_ignore_group_signals)
+    children: Children = current.get()
+    if children:
+        children.add(p.pid)
+    try:
+        (stdout, stderr) = await p.communicate()
+    except BaseException:
+        if p.returncode is None:
+            try:
+                p.kill()
+            except ProcessLookupError:
+                pass
+        raise
+    finally:
+        if children:
+            children.discard(p.pid)
+    return p.returncode, stdout, stderr
+
+
+def run(*args: str) -> Tuple[int, bytes, bytes]:
+    """Like communicate() for synchronous updates."""
+    from subprocess import Popen, PIPE
+    with _spawning():
+        p = Popen(args, stdin=PIPE, stdout=PIPE, stderr=PIPE,
+                  preexec_fn=_ignore_group_signals)
+    with p:
+        children: Children = current.get()
+        if children:
+            children.add(p.pid)
+        try:
+            (stdout, stderr) = p.communicate()
+        finally:
+            if children:
+                children.discard(p.pid)
+    return p.returncode, stdout, stderr
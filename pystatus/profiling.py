@@ -0,0 +1,304 @@
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+
+# seconds between two samples of the stacks of all threads
+SAMPLE_INTERVAL = 0.005
+# frames kept per allocation, enough to reach the plugin from the engine
+MEMORY_FRAMES = 32
+TOP = 10
+
+
+class Scope:
+    """Everything attributed to a single instance, the serializer or the
+    writer.
+
+    The thread running call() is attributed to the scope until it returns,
+    samples of that thread count towards the scope meanwhile.
+    """
+
+    def __init__(self, name: str, active: Dict[int, "Scope"]):
+        self._name = name
+        self._active = active
+        self.calls = 0
+        self.cpu = 0.0
+        self.wall = 0.0
+        self.samples = 0
+        # code object -> samples with it on top of, or anywhere in, the stack
+        self.own = collections.Counter()
+        self.total = collections.Counter()
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    def _enter(self) -> tuple:
+        ident = threading.get_ident()
+        prev = self._active.get(ident)
+        self._active[ident] = self
+        return ident, prev, time.monotonic(), time.thread_time()
+
+    def _leave(self, token: tuple) -> None:
+        ident, prev, start, cpu = token
+        self.cpu += time.thread_time() - cpu
+        self.wall += time.monotonic() - start
+        if prev is None:
+            self._active.pop(ident, None)
+        else:
+            self._active[ident] = prev
+
+    def call(self, fn: Callable, *args) -> Any:
+        self.calls += 1
+        token = self._enter()
+        try:
+            return fn(*args)
+        finally:
+            self._leave(token)
+
+    async def wrap(self, awaitable: Awaitable) -> Any:
+        """Await awaitable, attributing each of its steps to the scope.
+
+        Coroutines share the thread of the event loop, so only the time
+        between resuming and suspending them is theirs.
+        """
+        self.calls += 1
+        steps = awaitable.__await__()
+        value, error = None, None
+        while True:
+            token = self._enter()
+            try:
+                if error is not None:
+                    future = steps.throw(error)
+                else:
+                    future = steps.send(value)
+            except StopIteration as e:
+                return e.value
+            finally:
+                self._leave(token)
+            try:
+                value, error = await _Suspend(future), None
+            except BaseException as e:
+                value, error = None, e
+
+    def sample(self, frame) -> None:
+        self.samples += 1
+        self.own[frame.f_code] += 1
+        seen = set()
+        while frame is not None:
+            code = frame.f_code
+            if code not in seen:
+                seen.add(code)
+                self.total[code] += 1
+            frame = frame.f_back
+
+
+class _Suspend:
+    """Passes a future yielded by a wrapped coroutine on to the loop."""
+
+    __slots__ = ("_future",)
+
+    def __init__(self, future):
+        self._future = future
+
+    def __await__(self):
+        return (yield self._future)
+
+
+def _short(path: str) -> str:
+    # relative to the python library or site directory it is found in
+    for prefix in sorted(sys.path, key=len, reverse=True):
+        if prefix and path.startswith(prefix + os.sep):
+            return path[len(prefix) + 1:]
+    return path
+
+
+def _where(code) -> str:
+    return "%s:%d %s" % (_short(code.co_filename), code.co_firstlineno,
+                         code.co_name)
+
+
+def _size(n: float) -> str:
+    sign = "-" if n < 0 else "+"
+    n = abs(n)
+    for unit in ("B", "KiB", "MiB"):
+        if n < 1024:
+            break
+        n /= 1024
+    return "%s%.1f %s" % (sign, n, unit)
+
+
+class Profiler(threading.Thread):
+    """Samples the stacks of all threads running a scope.
+
+    CPU time is measured exactly per call of a scope, samples tell which
+    functions it was spent in. With a memory interval tracemalloc is
+    enabled and snapshots are taken and compared every interval seconds.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL,
+                 memory_interval: float = None):
+        super().__init__(name="pystatus_profiler", daemon=True)
+        self._interval = interval
+        self._memory_interval = memory_interval
+        self._active: Dict[int, Scope] = {}
+        self._scopes: Dict[str, Scope] = {}
+        # module file -> scope name, to attribute allocations
+        self._files: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._origin: Tuple[float, float] = None
+        self._elapsed: Tuple[float, float] = None
+        self._rounds = 0
+        self._snapshots = []
+        self._log = logging.getLogger("Profiler")
+
+    @property
+    def log(self) -> logging.Logger:
+        return self._log
+
+    def scope(self, name: str, owner: type = None) -> Scope:
+        """The scope of name, created on first use.
+
+        Allocations made by code in the module defining owner are
+        attributed to the scope by name, up to a colon.
+        """
+        scope = self._scopes.get(name)
+        if scope is None:
+            with self._lock:
+                scope = self._scopes.get(name)
+                if scope is None:
+                    scope = Scope(name, self._active)
+                    self._scopes[name] = scope
+                    self._track(owner, name.split(":")[0])
+        return scope
+
+    def _track(self, owner: type, name: str) -> None:
+        # external plugins aren't in sys.modules, so ask their functions
+        for attr in vars(owner).values() if owner else ():
+            code = getattr(attr, "__code__", None)
+            if code:
+                self._files.setdefault(code.co_filename, name)
+                return
+
+    def start(self) -> None:
+        if self._memory_interval:
+            import tracemalloc
+            tracemalloc.start(MEMORY_FRAMES)
+            self._snapshots.append((0.0, self._snapshot()))
+        times = os.times()
+        self._origin = (time.monotonic(), times.user + times.system)
+        super().start()
+
+    def run(self) -> None:
+        own = threading.get_ident()
+        next_snapshot = self._memory_interval
+        while not self._stopped.wait(self._interval):
+            self._rounds += 1
+            active = dict(self._active)
+            if active:
+                for ident, frame in sys._current_frames().items():
+                    scope = active.get(ident)
+                    if scope is not None and ident != own:
+                        scope.sample(frame)
+            if next_snapshot is not None:
+                elapsed = time.monotonic() - self._origin[0]
+                if elapsed >= next_snapshot:
+                    self._snapshots.append((elapsed, self._snapshot()))
+                    next_snapshot += self._memory_interval
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self.is_alive():
+            self.join()
+        if self._origin and not self._elapsed:
+            times = os.times()
+            self._elapsed = (time.monotonic() - self._origin[0],
+                             times.user + times.system - self._origin[1])
+        if self._memory_interval:
+            import tracemalloc
+            if tracemalloc.is_tracing():
+                self._snapshots.append((self._elapsed[0], self._snapshot()))
+                tracemalloc.stop()
+
+    def _snapshot(self):
+        import tracemalloc
+        snapshot = tracemalloc.take_snapshot()
+        # leave out what profiling itself allocates
+        return snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ))
+
+    def _owner(self, traceback) -> str:
+        # the outermost known module, e.g. a plugin calling into i3bar
+        for frame in traceback:
+            name = self._files.get(frame.filename)
+            if name:
+                return name
+        return "other"
+
+    def _cpu_report(self) -> List[str]:
+        wall, cpu = self._elapsed
+        lines = ["pystatus profile over %.1f s, %.2f s CPU, %d sample "
+                 "rounds every %.0f ms" % (wall, cpu, self._rounds,
+                                           self._interval * 1000), ""]
+        scopes = sorted(self._scopes.values(), key=lambda s: -s.cpu)
+        width = max([len(s.name) for s in scopes] + [5])
+        lines.append("%-*s %8s %10s %10s %8s %6s" % (
+            width, "scope", "calls", "cpu s", "wall s", "samples", "cpu%"))
+        attributed = 0.0
+        for s in scopes:
+            attributed += s.cpu
+            lines.append("%-*s %8d %10.4f %10.4f %8d %6.2f" % (
+                width, s.name, s.calls, s.cpu, s.wall, s.samples,
+                s.cpu / wall * 100 if wall else 0))
+        # the engines, the main loop, logging and the event thread
+        lines.append("%-*s %8s %10.4f %10s %8s %6.2f" % (
+            width, "other", "", max(cpu - attributed, 0.0), "", "",
+            max(cpu - attributed, 0.0) / wall * 100 if wall else 0))
+        for s in scopes:
+            if not s.samples:
+                continue
+            lines += ["", "%s, %d samples" % (s.name, s.samples),
+                      "  %6s %6s  function" % ("own", "total")]
+            codes = sorted(s.total, key=lambda c: (-s.own[c], -s.total[c]))
+            for code in codes[:TOP]:
+                lines.append("  %6d %6d  %s" % (s.own[code], s.total[code],
+                                                _where(code)))
+        return lines
+
+    def _memory_report(self) -> List[str]:
+        lines = ["", "Memory growth per %g s, by plugin" %
+                 self._memory_interval]
+        for (_, prev), (elapsed, cur) in zip(self._snapshots,
+                                              self._snapshots[1:]):
+            owners = collections.Counter()
+            for diff in cur.compare_to(prev, "traceback"):
+                owners[self._owner(diff.traceback)] += diff.size_diff
+            lines.append("  %7.1f s %12s  %s" % (
+                elapsed, _size(sum(owners.values())),
+                ", ".join("%s %s" % (name, _size(size))
+                          for name, size in owners.most_common()
+                          if size)))
+        first, last = self._snapshots[0][1], self._snapshots[-1][1]
+        lines += ["", "Largest growth by line since the start"]
+        for diff in last.compare_to(first, "lineno")[:TOP]:
+            if not diff.size_diff:
+                break
+            frame = diff.traceback[0]
+            lines.append("  %12s %+7d blocks  %s:%d" % (
+                _size(diff.size_diff), diff.count_diff,
+                _short(frame.filename), frame.lineno))
+        return lines
+
+    def report(self) -> str:
+        """The attribution of CPU time and memory as text."""
+        lines = self._cpu_report()
+        if len(self._snapshots) > 1:
+            lines += self._memory_report()
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,125 @@
+import re
+from string import Formatter
+from typing import Any, Optional, Tuple, Union
+
+
+# [[fill]align][sign][z][#][0][width][grouping][.precision][type]
+_SPEC = re.compile(r"^(?:.?[<>=^])?[+\- ]?z?#?0?\d*[,_]?"
+                   r"(?:\.(?P<precision>\d+))?(?P<type>[a-zA-Z%])?$")
+_FIELD = re.compile(r"[.\[]")
+_NUMBERS = (int, float)
+
+
+def precision(spec: str) -> Optional[float]:
+    """Step a number formatted with spec is rendered in.
+
+    Returns None if the value is rendered exactly, or in relative precision
+    like with "g".
+    """
+    m = _SPEC.match(spec or "")
+    if not m:
+        return None
+    kind, digits = m.group("type"), m.group("precision")
+    if kind in ("f", "F"):
+        return 10 ** -int(digits or 6)
+    if kind == "%":
+        return 10 ** -(int(digits or 6) + 2)
+    if kind == "d":
+        return 1
+    return None
+
+
+class Template:
+    """A str.format template parsed once.
+
+    render() quantizes numbers to the precision they are rendered with and
+    only formats the template if any of the shown values changed. With
+    hysteresis a number has to move further than half a step, measured in
+    steps, away from the shown value before a new one is shown, so values
+    around a rounding boundary don't flap.
+    """
+
+    def __init__(self, fmt: str, hysteresis: float = 0.0):
+        self._fmt = fmt
+        self._hysteresis = hysteresis
+        self._band = 0.5 + hysteresis
+        self._text: str = None
+        self._shown: Tuple[Any, ...] = None
+
+        quanta = {}
+        auto = 0
+        for _, field, spec, conversion in Formatter().parse(fmt):
+            if field is None:
+                continue
+            if field == "":
+                key: Union[int, str] = auto
+                auto += 1
+            else:
+                name = _FIELD.split(field, 1)[0]
+                key = int(name) if name.isdigit() else name
+            quantum = None
+            if field == "" or field == str(key):
+                if not conversion and "{" not in spec:
+                    quantum = precision(spec)
+            if key in quanta and quanta[key] != quantum:
+                # rendered differently in several places, keep it exact
+                quantum = None
+            quanta[key] = quantum
+        self._keys = tuple(quanta)
+        self._quanta = tuple(quanta.values())
+        self._index = {key: i for i, key in enumerate(self._keys)}
+        self._fields = tuple(zip(self._keys, self._quanta))
+
+    @property
+    def fmt(self) -> str:
+        return self._fmt
+
+    @property
+    def text(self) -> str:
+        """The most recently rendered text."""
+        return self._text
+
+    @property
+    def quanta(self) -> dict:
+        return dict(zip(self._keys, self._quanta))
+
+    def value(self, key: Union[int, str] = 0) -> Any:
+        """The shown, quantized value of a field.
+
+        None before rendering, or if the template doesn't show the field.
+        """
+        i = self._index.get(key)
+        if self._shown is None or i is None:
+            return None
+        return self._shown[i]
+
+    def reset(self) -> None:
+        """Forget the shown values, the next render() always renders."""
+        self._shown = None
+
+    def render(self, *args, **kwargs) -> Optional[str]:
+        """Render the template, returns None if the output is unchanged."""
+        last = self._shown or (None,) * len(self._fields)
+        shown = []
+        # called every tick, so exact type checks keep bools out cheaply
+        for (key, quantum), prev in zip(self._fields, last):
+            value = args[key] if type(key) is int else kwargs[key]
+            if quantum is not None and type(value) in _NUMBERS:
+                if (type(prev) in _NUMBERS
+                        and abs(value - prev) <= quantum * self._band):
+                    value = prev
+                else:
+                    value = round(value / quantum) * quantum
+            shown.append(value)
+        shown = tuple(shown)
+        if shown == self._shown:
+            return None
+        self._shown = shown
+        args = list(args)
+        for key, value in zip(self._keys, shown):
+            if isinstance(key, int):
+                args[key] = value
+            else:
+                kwargs[key] = value
+        self._text = self._fmt.format(*args, **kwargs)
+        return self._text
@@ -0,0 +1,106 @@
+import logging
+import threading
+import time
+from typing import Callable
+
+
+# seconds until marking a block stale is tried again, if it was locked
+RETRY = 0.1
+
+
+class Watchdog(threading.Thread):
+    """Notices updates running past their deadline.
+
+    Instances announce every update by watch() and done(). The thread only
+    wakes up for the earliest deadline of the updates running, and not at
+    all while none is, so it costs next to nothing while all is well.
+    Expired instances get timed_out() called once and mark_stale() until
+    it succeeds, both have to return quickly. Engines may also have a
+    function called at a deadline by call_at(), unless cancelled before.
+    """
+
+    def __init__(self):
+        super().__init__(name="pystatus_watchdog", daemon=True)
+        self._cond = threading.Condition()
+        self._deadlines = {}
+        self._expired = set()
+        # key -> (deadline, function) of call_at()
+        self._calls = {}
+        # monotonic time the thread wakes up at next, None if idle
+        self._wake_at: float = None
+        self._log = logging.getLogger("Watchdog")
+
+    @property
+    def log(self) -> logging.Logger:
+        return self._log
+
+    def watch(self, inst, deadline: float) -> None:
+        with self._cond:
+            self._deadlines[inst] = deadline
+            if self._wake_at is None or deadline < self._wake_at:
+                self._cond.notify()
+
+    def done(self, inst) -> None:
+        with self._cond:
+            self._deadlines.pop(inst, None)
+            self._expired.discard(inst)
+
+    def call_at(self, key, deadline: float, fn: Callable[[], None]) -> None:
+        """Call fn at deadline, replacing a pending call of the same key."""
+        with self._cond:
+            self._calls[key] = (deadline, fn)
+            if self._wake_at is None or deadline < self._wake_at:
+                self._cond.notify()
+
+    def cancel(self, key) -> None:
+        with self._cond:
+            self._calls.pop(key, None)
+
+    def _expire(self, now: float) -> float:
+        earliest = None
+        for key, (deadline, fn) in list(self._calls.items()):
+            if deadline <= now:
+                del self._calls[key]
+                fn()
+            elif earliest is None or deadline < earliest:
+                earliest = deadline
+        for inst, deadline in list(self._deadlines.items()):
+            if deadline <= now:
+                if inst not in self._expired:
+                    self._expired.add(inst)
+                    inst.timed_out()
+                if inst.mark_stale(blocking=False):
+                    del self._deadlines[inst]
+                    continue
+                # the instance holds the lock of its block right now
+                deadline = self._deadlines[inst] = now + RETRY
+            if earliest is None or deadline < earliest:
+                earliest = deadline
+        return earliest
+
+    def run(self) -> None:
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                try:
+                    self._wake_at = self._expire(now)
+                except Exception:
+                    self.log.exception("Failed to handle expired update")
+                    self._wake_at = now + RETRY
+                self._cond.wait(None if self._wake_at is None
+                                else self._wake_at - now)
+
+
+_watchdog: Watchdog = None
+_watchdog_lock = threading.Lock()
+
+
+def watchdog() -> Watchdog:
+    global _watchdog
+    if _watchdog is None:
+        with _watchdog_lock:
+            if _watchdog is None:
+                dog = Watchdog()
+                dog.start()
+                _watchdog = dog
+    return _watchdog
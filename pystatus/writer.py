@@ -0,0 +1,123 @@
+import logging
+import os
+import selectors
+import threading
+from pystatus.events import dispatcher
+
+
+WRITERS = ["blocking", "nonblocking"]
+
+
+class FrameWriter:
+    """Writes to a file descriptor in non-blocking mode.
+
+    Data passed to write() is always delivered, in order. Frames passed to
+    write_frame() are replaced by newer ones while the reader doesn't keep
+    up, at most one frame is kept pending, so a reader catching up only
+    gets the latest state. Whatever couldn't be written right away is
+    written by the event dispatcher once the descriptor becomes writable,
+    so writing never blocks.
+    """
+
+    def __init__(self, fd: int):
+        self._fd = fd
+        self._log = logging.getLogger("FrameWriter")
+        self._blocking = os.get_blocking(fd)
+        os.set_blocking(fd, False)
+        self._lock = threading.Lock()
+        self._drained = threading.Condition(self._lock)
+        # bytes which have to be written, including a partly written frame
+        self._buf = bytearray()
+        self._frame: bytes = None
+        self._watching = False
+        self._closed = False
+        self._dropped = 0
+
+    @property
+    def log(self) -> logging.Logger:
+        return self._log
+
+    @property
+    def fd(self) -> int:
+        return self._fd
+
+    @property
+    def dropped(self) -> int:
+        """Number of frames replaced before they were written."""
+        return self._dropped
+
+    def write(self, data: str) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            # a pending frame was sent first, keep the order
+            self._commit()
+            self._buf += data.encode("utf8")
+            self._drain()
+
+    def write_frame(self, data: str) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            if not self._buf:
+                self._buf += data.encode("utf8")
+                self._drain()
+                return
+            if self._frame is not None:
+                self._dropped += 1
+            self._frame = data.encode("utf8")
+
+    def flush(self) -> None:
+        """Pending data is written in the background, nothing to do."""
+
+    def close(self, timeout: float = 1.0) -> None:
+        """Wait up to timeout seconds for pending data to be written."""
+        with self._lock:
+            self._drained.wait_for(
+                lambda: self._closed or not (self._buf or self._frame),
+                timeout)
+            self._closed = True
+            self._unwatch()
+        os.set_blocking(self._fd, self._blocking)
+
+    def _commit(self) -> None:
+        if self._frame is not None:
+            self._buf += self._frame
+            self._frame = None
+
+    def _drain(self) -> None:
+        while not self._closed:
+            if not self._buf:
+                self._commit()
+                if not self._buf:
+                    break
+            try:
+                written = os.write(self._fd, self._buf)
+            except BlockingIOError:
+                self._watch()
+                return
+            except OSError as e:
+                # the reader is gone, e.g. BrokenPipeError
+                self.log.error("Failed to write: %s", e)
+                self._closed = True
+                self._buf.clear()
+                self._frame = None
+                break
+            del self._buf[:written]
+        self._unwatch()
+        self._drained.notify_all()
+
+    def _on_writable(self) -> None:
+        with self._lock:
+            self._drain()
+
+    def _watch(self) -> None:
+        if not self._watching:
+            self._watching = True
+            dispatcher().register(self._fd, self._on_writable,
+                                  selectors.EVENT_WRITE)
+
+    def _unwatch(self) -> None:
+        if self._watching:
+            self._watching = False
+            dispatcher().unregister(self._fd)